@@ -17,15 +17,73 @@ Date: 2025
 """
 
 import os
+import json
+import string
 import pandas as pd
 from google.cloud import bigquery
 from airflow.utils.email import send_email
 from datapipeline.scripts.logger_setup import get_logger
+from datapipeline.scripts.bq_client import get_client, close_client
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 class AnomalyDetection:
-    
+
+    # HTML body for validation failure alerts, compiled once at class load
+    _EMAIL_TMPL = string.Template("""
+            <h2>Data Validation Failure</h2>
+            <p><strong>Pipeline:</strong> Goodreads Recommendation System</p>
+            <p><strong>Status:</strong> FAILED - Pipeline stopped</p>
+            <p><strong>Error:</strong> $message</p>
+            
+            <p><strong>Action Required:</strong> Please investigate and fix the data quality issues before re-running the pipeline.</p>
+            <p><em>This is an automated alert from the Goodreads Data Pipeline.</em></p>
+            """)
+
+    # Fused validation queries: row count plus one violation counter per check
+    _BOOKS_SOURCE_SQL = string.Template("""
+        SELECT
+            COUNT(*) AS row_count,
+            COUNTIF(book_id IS NULL) AS null_book_id,
+            COUNTIF(title IS NULL) AS null_title
+        FROM `$fq`
+        """)
+    _BOOKS_CLEANED_SQL = string.Template("""
+        SELECT
+            COUNT(*) AS row_count,
+            COUNTIF(title_clean IS NULL) AS null_title,
+            COUNTIF(publication_year IS NULL OR publication_year <= 0) AS invalid_publication_year,
+            COUNTIF(num_pages IS NULL OR num_pages <= 0) AS invalid_num_pages
+        FROM `$fq`
+        """)
+    _INTERACTIONS_SOURCE_SQL = string.Template("""
+        SELECT
+            COUNT(*) AS row_count,
+            COUNTIF(user_id IS NULL) AS null_user_id,
+            COUNTIF(book_id IS NULL) AS null_book_id
+        FROM `$fq`
+        """)
+    _INTERACTIONS_CLEANED_SQL = string.Template("""
+        SELECT
+            COUNT(*) AS row_count,
+            COUNTIF(user_id_clean IS NULL) AS null_user_id,
+            COUNTIF(book_id IS NULL) AS null_book_id,
+            COUNTIF(rating < 0 OR rating > 5) AS invalid_rating
+        FROM `$fq`
+        """)
+
+    # Last-modified metadata lookup (no table scan) for tables passed as the @tbls parameter
+    _LAST_MODIFIED_SQL = string.Template("""
+        SELECT table_id, last_modified_time
+        FROM `$dataset_ref.__TABLES__`
+        WHERE table_id IN UNNEST(@tbls)
+        """)
+
+    # Cleaned staging tables checked by post-cleaning validation
+    _CLEANED_TABLES = ("goodreads_books_cleaned_staging", "goodreads_interactions_cleaned_staging")
+
     def __init__(self):
         """
         Initialize the AnomalyDetection class with BigQuery client and configuration.
@@ -35,6 +93,7 @@ class AnomalyDetection:
         - Logging configuration for anomaly detection operations
         - BigQuery client and project information
         - Dataset reference for validation queries
+        - Marker file used to skip post-validation of unchanged tables
         """
         # Set Google Application Credentials for BigQuery access
         # Uses AIRFLOW_HOME environment variable to locate credentials file
@@ -44,9 +103,12 @@ class AnomalyDetection:
         self.logger = get_logger("anomaly_detection")
         
         # Initialize BigQuery client and get project information
-        self.client = bigquery.Client()
+        self.client = get_client()
         self.project_id = self.client.project
         self.dataset = "books"
+        
+        # Marker recording cleaned-table modification times at the last successful post-validation
+        self.post_validation_marker = os.environ.get("AIRFLOW_HOME") + "/post_validation_marker.json"
 
     def validate_data_quality(self, use_cleaned_tables=False):
         """
@@ -59,17 +121,20 @@ class AnomalyDetection:
             bool: True if all validations pass, False otherwise
             
         This method orchestrates validation of both books and interactions tables
-        and implements a zero-tolerance policy - any violations stop the pipeline.
+        (run in parallel) and implements a zero-tolerance policy - any violations
+        stop the pipeline.
         """
         try:
             validation_type = "cleaned" if use_cleaned_tables else "source"
             self.logger.info(f"Starting BigQuery data validation for {validation_type} tables...")
             
-            # Validate books table using appropriate validation rules
-            books_success = self.validate_books_with_bigquery(use_cleaned_tables)
-            
-            # Validate interactions table using appropriate validation rules
-            interactions_success = self.validate_interactions_with_bigquery(use_cleaned_tables)
+            # Validate books and interactions tables concurrently - the checks are independent
+            # and each one mostly waits on BigQuery (the client is thread-safe for queries)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                books_future = executor.submit(self.validate_books_with_bigquery, use_cleaned_tables)
+                interactions_future = executor.submit(self.validate_interactions_with_bigquery, use_cleaned_tables)
+                books_success = books_future.result()
+                interactions_success = interactions_future.result()
             
             # Check overall success - zero tolerance policy
             if not books_success or not interactions_success:
@@ -83,31 +148,91 @@ class AnomalyDetection:
             self.logger.error(f"Data validation failed: {e}")
             raise
 
-    def get_table_structure(self, table_name):
+    def get_last_modified_times(self, table_names):
         """
-        Get table structure information from BigQuery INFORMATION_SCHEMA.
+        Get last-modified times for several tables from BigQuery table metadata.
         
         Args:
-            table_name (str): Name of the table to get structure for
+            table_names (list[str]): Names of the tables to look up
             
         Returns:
-            pandas.DataFrame: DataFrame with column information, or None if error
+            dict: Mapping of table name to last_modified_time (epoch milliseconds),
+                  or None if error
         """
         try:
-            # Query BigQuery INFORMATION_SCHEMA to get column details
-            columns_info = self.client.query(f"""
-                SELECT column_name, data_type
-                FROM `{self.project_id}.{self.dataset}.INFORMATION_SCHEMA.COLUMNS`
-                WHERE table_name = '{table_name}'
-                ORDER BY ordinal_position
-            """).to_dataframe(create_bqstorage_client=False)
-            
-            self.logger.info(f"Retrieved {len(columns_info)} columns for table {table_name}")
-            return columns_info
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ArrayQueryParameter("tbls", "STRING", list(table_names))]
+            )
+            query = self._LAST_MODIFIED_SQL.substitute(dataset_ref=f"{self.project_id}.{self.dataset}")
+            rows = self.client.query(query, job_config=job_config).result()
+            return {row["table_id"]: int(row["last_modified_time"]) for row in rows}
         except Exception as e:
-            self.logger.error(f"Error fetching table structure for {table_name}: {e}")
+            self.logger.error(f"Error fetching last modified times for {', '.join(table_names)}: {e}")
+            return None
+
+    def load_post_validation_marker(self):
+        """
+        Load the table modification times recorded at the last successful post-validation.
+        
+        Returns:
+            dict: Mapping of table name to last_modified_time, or None if no marker exists
+        """
+        try:
+            with open(self.post_validation_marker) as f:
+                return json.load(f)
+        except (OSError, ValueError):
             return None
 
+    def save_post_validation_marker(self, last_modified):
+        """
+        Record table modification times after a successful post-validation.
+        
+        Args:
+            last_modified (dict): Mapping of table name to last_modified_time
+        """
+        try:
+            with open(self.post_validation_marker, "w") as f:
+                json.dump(last_modified, f)
+        except OSError as e:
+            self.logger.error(f"Failed to write post-validation marker: {e}")
+
+    def run_fused_validation(self, table_name, table_label, sql_template, max_allowed):
+        """
+        Run all validation checks for a table in a single BigQuery aggregation query.
+        
+        Args:
+            table_name (str): Name of the table to validate
+            table_label (str): Human-readable table label used in log messages
+            sql_template (string.Template): Fused validation query template taking the table as $fq
+            max_allowed (dict): Maximum allowed violations per result column
+            
+        Returns:
+            bool: True if the table is non-empty and all checks pass, False otherwise
+            
+        The row count and every violation count are computed together in one scan,
+        so each table costs a single BigQuery job per validation run.
+        """
+        # Row count plus every violation counter in one query
+        query = sql_template.substitute(fq=f"{self.project_id}.{self.dataset}.{table_name}")
+        # The aggregate is a single row, so read it directly instead of building a DataFrame
+        result = next(iter(self.client.query(query).result()))
+        
+        # Short-circuit on empty tables before looking at violation counts
+        row_count = result['row_count']
+        if row_count == 0:
+            self.logger.error(f"{table_label} table is empty")
+            return False
+        
+        # Compare all violation counts against their thresholds in one pass (uniform handling for pre/post)
+        results = {k: int(v) for k, v in result.items() if k.startswith(("null_", "invalid_"))}
+        violations = {k: v for k, v in results.items() if v > max_allowed[k]}
+        
+        # Only failures are logged separately; everything else goes into one summary line
+        if violations:
+            self.logger.error(f"{table_label} validation violations found (max allowed: {max_allowed}): {json.dumps(violations)}")
+        self.logger.info("%s validation_results %s", table_name, json.dumps({"row_count": int(row_count), **results}))
+        return not violations
+
     def validate_books_with_bigquery(self, use_cleaned_tables=False):
         """
         Validate books table using BigQuery SQL queries with appropriate validation rules.
@@ -127,89 +252,16 @@ class AnomalyDetection:
             
             self.logger.info(f"Validating books table: {table_name}")
             
-            # Check if table exists and get row count
-            count_query = f"""
-            SELECT COUNT(*) as row_count
-            FROM `{self.project_id}.{self.dataset}.{table_name}`
-            """
-            count_result = self.client.query(count_query).to_dataframe(create_bqstorage_client=False)
-            row_count = count_result['row_count'].iloc[0]
-            
-            if row_count == 0:
-                self.logger.error("Books table is empty")
-                return False
-            
-            self.logger.info(f"Books table has {row_count} rows")
-            
-            # Data quality validation queries
+            # Data quality validation query and thresholds
             if not use_cleaned_tables:
-                validation_queries = [
-                    {
-                        "name": "Check for null book_id",
-                        "query": f"""
-                        SELECT COUNT(*) as null_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE book_id IS NULL
-                        """,
-                        "max_allowed": 0
-                    },
-                    {
-                        "name": "Check for null title",
-                        "query": f"""
-                        SELECT COUNT(*) as null_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE title IS NULL
-                        """,
-                        "max_allowed": 0
-                    },
-                ]
+                sql_template = self._BOOKS_SOURCE_SQL
+                max_allowed = {"null_book_id": 0, "null_title": 0}
             else:
-                validation_queries = [
-                    {
-                        "name": "Check for null title",
-                        "query": f"""
-                        SELECT COUNT(*) as null_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE title_clean IS NULL
-                        """,
-                        "max_allowed": 0
-                    },
-                    {
-                        "name": "Check publication_year range",
-                        "query": f"""
-                        SELECT COUNT(*) as invalid_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE publication_year IS NULL OR publication_year <= 0
-                        """,
-                        "max_allowed": 0
-                    },
-                    {
-                        "name": "Check num_pages range",
-                        "query": f"""
-                        SELECT COUNT(*) as invalid_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE num_pages IS NULL OR num_pages <= 0
-                        """,
-                        "max_allowed": 0
-                    }
-                ]
-            
-            # Run validation queries (uniform handling for pre/post)
-            all_passed = True
-            for validation in validation_queries:
-                try:
-                    result = self.client.query(validation["query"]).to_dataframe(create_bqstorage_client=False)
-                    invalid_count = result.iloc[0, 0]
-                    if invalid_count > validation["max_allowed"]:
-                        self.logger.error(f"{validation['name']}: {invalid_count} violations found (max allowed: {validation['max_allowed']})")
-                        all_passed = False
-                    else:
-                        self.logger.info(f"{validation['name']}: PASSED ({invalid_count} violations)")
-                except Exception as e:
-                    self.logger.error(f"Error running validation '{validation['name']}': {e}")
-                    all_passed = False
-            
-            if all_passed:
+                sql_template = self._BOOKS_CLEANED_SQL
+                max_allowed = {"null_title": 0, "invalid_publication_year": 0, "invalid_num_pages": 0}
+            
+            # Run row count and all checks as a single fused query
+            if self.run_fused_validation(table_name, "Books", sql_template, max_allowed):
                 self.logger.info("Books table validation passed")
                 return True
             else:
@@ -232,89 +284,16 @@ class AnomalyDetection:
             
             self.logger.info(f"Validating interactions table: {table_name}")
             
-            # Check if table exists and get row count
-            count_query = f"""
-            SELECT COUNT(*) as row_count
-            FROM `{self.project_id}.{self.dataset}.{table_name}`
-            """
-            count_result = self.client.query(count_query).to_dataframe(create_bqstorage_client=False)
-            row_count = count_result['row_count'].iloc[0]
-            
-            if row_count == 0:
-                self.logger.error("Interactions table is empty")
-                return False
-            
-            self.logger.info(f"Interactions table has {row_count} rows")
-            
-            # Data quality validation queries
+            # Data quality validation query and thresholds
             if not use_cleaned_tables:
-                validation_queries = [
-                    {
-                        "name": "Check for null user_id",
-                        "query": f"""
-                        SELECT COUNT(*) as null_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE user_id IS NULL
-                        """,
-                        "max_allowed": 0
-                    },
-                    {
-                        "name": "Check for null book_id",
-                        "query": f"""
-                        SELECT COUNT(*) as null_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE book_id IS NULL
-                        """,
-                        "max_allowed": 0
-                    },
-                ]
+                sql_template = self._INTERACTIONS_SOURCE_SQL
+                max_allowed = {"null_user_id": 0, "null_book_id": 0}
             else:
-                validation_queries = [
-                    {
-                        "name": "Check for null user_id",
-                        "query": f"""
-                        SELECT COUNT(*) as null_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE user_id_clean IS NULL
-                        """,
-                        "max_allowed": 0
-                    },
-                    {
-                        "name": "Check for null book_id",
-                        "query": f"""
-                        SELECT COUNT(*) as null_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE book_id IS NULL
-                        """,
-                        "max_allowed": 0
-                    },
-                    {
-                        "name": "Check rating range",
-                        "query": f"""
-                        SELECT COUNT(*) as invalid_count
-                        FROM `{self.project_id}.{self.dataset}.{table_name}`
-                        WHERE rating < 0 OR rating > 5
-                        """,
-                        "max_allowed": 0
-                    }
-                ]
-            
-            # Run validation queries (uniform handling for pre/post)
-            all_passed = True
-            for validation in validation_queries:
-                try:
-                    result = self.client.query(validation["query"]).to_dataframe(create_bqstorage_client=False)
-                    invalid_count = result.iloc[0, 0]
-                    if invalid_count > validation["max_allowed"]:
-                        self.logger.error(f"{validation['name']}: {invalid_count} violations found (max allowed: {validation['max_allowed']})")
-                        all_passed = False
-                    else:
-                        self.logger.info(f"{validation['name']}: PASSED ({invalid_count} violations)")
-                except Exception as e:
-                    self.logger.error(f"Error running validation '{validation['name']}': {e}")
-                    all_passed = False
-            
-            if all_passed:
+                sql_template = self._INTERACTIONS_CLEANED_SQL
+                max_allowed = {"null_user_id": 0, "null_book_id": 0, "invalid_rating": 0}
+            
+            # Run row count and all checks as a single fused query
+            if self.run_fused_validation(table_name, "Interactions", sql_template, max_allowed):
                 self.logger.info("Interactions table validation passed")
                 return True
             else:
@@ -335,27 +314,39 @@ class AnomalyDetection:
             message (str): Error message describing the validation failure
             
         This method sends an HTML email notification when data validation fails,
-        providing details about the failure and required actions.
+        providing details about the failure and required actions. The SMTP delivery
+        runs on a background thread so the failing task is not blocked on it.
         """
         try:
             subject = "[CRITICAL] Data Validation Failed - Goodreads Pipeline"
             
             # Create HTML email content with failure details
-            html_content = f"""
-            <h2>Data Validation Failure</h2>
-            <p><strong>Pipeline:</strong> Goodreads Recommendation System</p>
-            <p><strong>Status:</strong> FAILED - Pipeline stopped</p>
-            <p><strong>Error:</strong> {message}</p>
+            html_content = self._EMAIL_TMPL.substitute(message=message)
             
-            <p><strong>Action Required:</strong> Please investigate and fix the data quality issues before re-running the pipeline.</p>
-            <p><em>This is an automated alert from the Goodreads Data Pipeline.</em></p>
-            """
+            # Send email notification to configured recipient in the background
+            # Non-daemon so the interpreter still waits for delivery before exiting
+            threading.Thread(
+                target=self._deliver_email,
+                kwargs={"subject": subject, "html_content": html_content},
+                name="validation-failure-email",
+            ).start()
             
-            # Send email notification to configured recipient
-            send_email(to=os.environ.get("AIRFLOW__SMTP__SMTP_USER"), subject=subject, html_content=html_content)
+            self.logger.info("Validation failure email dispatched")
             
+        except Exception as e:
+            self.logger.error(f"Failed to send email: {e}")
+
+    def _deliver_email(self, subject, html_content):
+        """
+        Deliver a notification email over SMTP, logging any delivery failure.
+        
+        Args:
+            subject (str): Email subject line
+            html_content (str): HTML body of the email
+        """
+        try:
+            send_email(to=os.environ.get("AIRFLOW__SMTP__SMTP_USER"), subject=subject, html_content=html_content)
             self.logger.info("Validation failure email sent")
-            
         except Exception as e:
             self.logger.error(f"Failed to send email: {e}")
 
@@ -399,6 +390,8 @@ class AnomalyDetection:
         
         This method validates cleaned data after processing to ensure the cleaning
         operations were successful and the data meets quality standards for ML training.
+        Validation is skipped when the cleaned tables are unchanged since the last
+        successful post-validation (e.g. on task retries).
         
         Returns:
             bool: True if validation passes, raises exception if it fails
@@ -411,9 +404,19 @@ class AnomalyDetection:
             self.logger.info(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             self.logger.info("=" * 60)
             
+            # Skip validation if the cleaned tables have not changed since the last successful run
+            last_modified = self.get_last_modified_times(self._CLEANED_TABLES)
+            if last_modified and last_modified == self.load_post_validation_marker():
+                self.logger.info("Cleaned tables unchanged since last successful validation - skipping")
+                return True
+            
             # Validate cleaned tables after processing
             result = self.validate_data_quality(use_cleaned_tables=True)
             
+            # Remember the validated table versions (validation raises on failure)
+            if last_modified:
+                self.save_post_validation_marker(last_modified)
+            
             # Log completion statistics
             end_time = time.time()
             self.logger.info("=" * 60)
@@ -427,6 +430,15 @@ class AnomalyDetection:
             self.logger.error(f"Error in post-cleaning validation: {e}")
             raise
 
+    def close(self):
+        """
+        Release the shared BigQuery client's connections.
+        
+        Called by the entry points below once validation finishes, so workers that
+        re-run the DAG do not accumulate open connections.
+        """
+        close_client()
+
 def main_pre_validation():
     """
     Pre-cleaning validation function - validates source tables.
@@ -438,7 +450,10 @@ def main_pre_validation():
         bool: True if validation passes, raises exception if it fails
     """
     anomaly_detector = AnomalyDetection()
-    return anomaly_detector.run_pre_validation()
+    try:
+        return anomaly_detector.run_pre_validation()
+    finally:
+        anomaly_detector.close()
 
 def main_post_validation():
     """
@@ -451,7 +466,10 @@ def main_post_validation():
         bool: True if validation passes, raises exception if it fails
     """
     anomaly_detector = AnomalyDetection()
-    return anomaly_detector.run_post_validation()
+    try:
+        return anomaly_detector.run_post_validation()
+    finally:
+        anomaly_detector.close()
 
 def main(use_cleaned_tables=False):
     """
@@ -464,10 +482,13 @@ def main(use_cleaned_tables=False):
         bool: True if validation passes, raises exception if it fails
     """
     anomaly_detector = AnomalyDetection()
-    if use_cleaned_tables:
-        return anomaly_detector.run_post_validation()
-    else:
-        return anomaly_detector.run_pre_validation()
+    try:
+        if use_cleaned_tables:
+            return anomaly_detector.run_post_validation()
+        else:
+            return anomaly_detector.run_pre_validation()
+    finally:
+        anomaly_detector.close()
 
 if __name__ == "__main__":
     # Allow the script to be run directly for testing or development
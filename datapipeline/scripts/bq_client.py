@@ -0,0 +1,60 @@
+"""
+Shared BigQuery Client Module for Goodreads Data Pipeline
+
+This module provides a single, lazily created BigQuery client shared by all
+pipeline components running in the same process.
+
+Key Features:
+- Creates the BigQuery client on first use, after credentials are configured
+- Reuses one client (auth, HTTP session and connection pool) across components
+- Thread-safe initialization for components that issue queries concurrently
+- Explicit shutdown so long-lived workers do not accumulate open connections
+
+Author: Goodreads Recommendation Team
+Date: 2025
+"""
+
+import threading
+from google.cloud import bigquery
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Get the process-wide BigQuery client, creating it on first use.
+
+    Returns:
+        bigquery.Client: Shared BigQuery client
+
+    Callers must set GOOGLE_APPLICATION_CREDENTIALS before the first call, as
+    the client picks up credentials when it is created.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = bigquery.Client()
+        return _client
+
+def close_client():
+    """
+    Close the shared BigQuery client's connections and drop it.
+
+    Called by each pipeline entry point when it finishes, so Airflow workers that
+    execute many tasks do not keep idle connections open between runs.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+def reset_client():
+    """
+    Drop the shared BigQuery client so the next get_client() call creates a new one.
+
+    Used when credentials change and by tests that swap in mocked clients.
+    """
+    global _client
+    with _client_lock:
+        _client = None
@@ -16,15 +16,63 @@ Date: 2025
 """
 
 import os
+import pandas as pd
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
 from datapipeline.scripts.logger_setup import get_logger
+from datapipeline.scripts.bq_client import get_client, close_client
 import time
 from datetime import datetime
 from gender_guesser.detector import Detector
-from tqdm import tqdm
-import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from cachetools import TTLCache
+
+# INFORMATION_SCHEMA column info keyed by (project, dataset, table); schemas do not change within a DAG run
+_schema_cache = TTLCache(maxsize=64, ttl=300)
+_schema_lock = threading.Lock()
+
+
+def _map_gender(g):
+    """
+    Map a gender-guesser result to our gender categories.
+    
+    Args:
+        g (str): Result returned by Detector.get_gender
+        
+    Returns:
+        str: 'Male', 'Female', or 'Unknown'
+    """
+    if g in ["male", "mostly_male"]:
+        return "Male"
+    elif g in ["female", "mostly_female"]:
+        return "Female"
+    else:
+        return "Unknown"
+
+
+@lru_cache(maxsize=1)
+def _gender_lookup():
+    """
+    Build a lowercase first name -> gender category dict from gender-guesser's name table.
+    
+    Returns:
+        dict: Mapping of every name known to the detector to 'Male', 'Female' or 'Unknown'
+        
+    The detector's multi-country entries are resolved once per process, so
+    classifying first names afterwards is a plain dict lookup.
+    """
+    detector = Detector(case_sensitive=False)
+    return {name: _map_gender(detector.get_gender(name)) for name in detector.names}
 
 class DataCleaning:
+
+    # Script-scoped UDF flattening an array column to JSON strings, dropping NULL elements
+    _CLEAN_ARRAY_UDF = """
+            CREATE TEMP FUNCTION clean_arr(a ANY TYPE) AS (
+                ARRAY(SELECT TO_JSON_STRING(x) FROM UNNEST(a) AS x WHERE x IS NOT NULL)
+            );"""
     
     def __init__(self):
         """
@@ -47,115 +95,360 @@ class DataCleaning:
         # These are numeric columns where median is more appropriate than mean
         self.median_numeric_cols = ["publication_year", "num_pages"]
 
+        # Medians are nearly stationary; reuse persisted values for this many days before recomputing
+        self.median_cache_days = 7
+
         # Initialize BigQuery client and get project information
-        self.client = bigquery.Client()
+        self.client = get_client()
         self.project_id = self.client.project
+
+    def _get_columns_info(self, dataset_id: str, table_name: str):
+        """
+        Get column names and data types for a table from BigQuery INFORMATION_SCHEMA.
         
+        Args:
+            dataset_id (str): BigQuery dataset ID containing the table
+            table_name (str): Name of the table to describe
+            
+        Returns:
+            dict: Column name -> data type, in table column order
+            
+        Results are kept in a module-level TTL cache so repeated lookups of the
+        same table within a run do not issue another metadata query.
+        """
+        key = (self.project_id, dataset_id, table_name)
+        with _schema_lock:
+            if key in _schema_cache:
+                return _schema_cache[key]
 
-    def clean_table(self, dataset_id: str, table_name: str, destination_table: str, apply_global_median: bool = False):
+        # Table name is passed as a query parameter so the SQL text stays identical across tables
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter("table_name", "STRING", table_name)]
+        )
+        # Read the tiny result as plain rows; ordinal order fixes the cleaned table's column order
+        rows = self.client.query(f"""
+            SELECT column_name, data_type
+            FROM `{self.project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMNS`
+            WHERE table_name = @table_name
+            ORDER BY ordinal_position
+        """, job_config=job_config).result()
+        columns_info = {row["column_name"]: row["data_type"] for row in rows}
+
+        with _schema_lock:
+            _schema_cache[key] = columns_info
+        return columns_info
+
+    def _load_schemas(self, dataset_id: str, table_names):
         """
-        Clean a BigQuery table by applying data cleaning transformations.
+        Fetch column info for several tables of a dataset with one INFORMATION_SCHEMA query.
+        
+        Args:
+            dataset_id (str): BigQuery dataset ID containing the tables
+            table_names (list): Names of the tables to describe
+            
+        Tables already in the schema cache are skipped. The results fill the same
+        cache _get_columns_info reads, which still lazily loads any table missed here.
+        """
+        with _schema_lock:
+            missing = [t for t in table_names if (self.project_id, dataset_id, t) not in _schema_cache]
+        # A single table is described by _get_columns_info's own lookup
+        if len(missing) < 2:
+            return
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ArrayQueryParameter("table_names", "STRING", missing)]
+        )
+        rows = self.client.query(f"""
+            SELECT table_name, column_name, data_type
+            FROM `{self.project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMNS`
+            WHERE table_name IN UNNEST(@table_names)
+            ORDER BY table_name, ordinal_position
+        """, job_config=job_config).result()
+
+        schemas = {}
+        for row in rows:
+            schemas.setdefault(row["table_name"], {})[row["column_name"]] = row["data_type"]
+
+        with _schema_lock:
+            for table_name, columns_info in schemas.items():
+                _schema_cache[(self.project_id, dataset_id, table_name)] = columns_info
+        self.logger.info(f"Retrieved schemas for {len(schemas)} tables in {dataset_id}")
+
+    def _median_var(self, table_name: str, col: str):
+        """
+        Get the script variable name holding the global median of a column.
+        
+        Args:
+            table_name (str): Name of the source table
+            col (str): Numeric column being imputed
+            
+        Returns:
+            str: Variable name, prefixed by table so several tables can share one script
+        """
+        return f"{table_name}_{col}_median"
+
+    def _get_cached_medians(self, dataset_id: str, table_name: str, median_cols):
+        """
+        Read recently computed medians from the column_medians table.
+        
+        Args:
+            dataset_id (str): BigQuery dataset ID containing the source table
+            table_name (str): Name of the source table
+            median_cols (list): Columns whose medians are needed
+            
+        Returns:
+            dict: Column name -> median for columns computed within the last
+                median_cache_days days. Empty if the table does not exist yet or
+                the lookup fails, in which case the medians are recomputed.
+        """
+        query = f"""
+            SELECT column_name, median
+            FROM `{self.project_id}.{dataset_id}.column_medians`
+            WHERE table_name = @table_name
+              AND column_name IN UNNEST(@columns)
+              AND median IS NOT NULL
+              AND computed_at > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @days DAY)
+        """
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("table_name", "STRING", table_name),
+            bigquery.ArrayQueryParameter("columns", "STRING", list(median_cols)),
+            bigquery.ScalarQueryParameter("days", "INT64", self.median_cache_days)
+        ])
+        try:
+            rows = self.client.query(query, job_config=job_config).result()
+            return {row["column_name"]: row["median"] for row in rows}
+        except Exception as e:
+            self.logger.warning(f"Could not read cached medians for {table_name}, recomputing them: {e}")
+            return {}
+
+    def build_median_statements(self, dataset_id: str, table_name: str):
+        """
+        Build the script statements that compute global medians into variables.
+        
+        Args:
+            dataset_id (str): BigQuery dataset ID containing the source table
+            table_name (str): Name of the source table
+            
+        Returns:
+            tuple: (list of DECLARE statements, statements that compute the medians,
+                or None if the table has none of the median columns or all cached
+                medians are fresh)
+                
+        Medians are computed once as scalar variables, so the cleaning query can
+        reference them directly instead of cross joining a medians CTE onto every row.
+        Freshly computed medians are persisted to column_medians and reused by later
+        runs for median_cache_days days, skipping the full-table quantile scan.
+        """
+        col_types = self._get_columns_info(dataset_id, table_name)
+        median_cols = [col for col in self.median_numeric_cols if col in col_types]
+        if not median_cols:
+            return [], None
+
+        # Use the persisted medians as variable defaults when all of them are still fresh
+        cached = self._get_cached_medians(dataset_id, table_name, median_cols)
+        if all(col in cached for col in median_cols):
+            self.logger.info(f"Using cached medians for {table_name}: {cached}")
+            declares = [
+                f"DECLARE {self._median_var(table_name, col)} {col_types[col]} "
+                f"DEFAULT CAST({cached[col]!r} AS {col_types[col]});"
+                for col in median_cols
+            ]
+            return declares, None
+
+        # Declare each variable with the column's own type so imputed columns keep their type
+        declares = [f"DECLARE {self._median_var(table_name, col)} {col_types[col]};" for col in median_cols]
+        medians_table = f"{self.project_id}.{dataset_id}.column_medians"
+        new_medians = " UNION ALL ".join(
+            f"SELECT '{table_name}' AS table_name, '{col}' AS column_name, "
+            f"CAST({self._median_var(table_name, col)} AS FLOAT64) AS median"
+            for col in median_cols
+        )
+        set_stmt = f"""
+            SET ({', '.join(self._median_var(table_name, col) for col in median_cols)}) = (
+                SELECT AS STRUCT
+                    {', '.join(f'APPROX_QUANTILES(NULLIF({col}, 0), 2)[OFFSET(1)]' for col in median_cols)}
+                FROM `{self.project_id}.{dataset_id}.{table_name}`
+            );
+            CREATE TABLE IF NOT EXISTS `{medians_table}` (
+                table_name STRING, column_name STRING, median FLOAT64, computed_at TIMESTAMP
+            );
+            MERGE `{medians_table}` t
+            USING ({new_medians}) s
+            ON t.table_name = s.table_name AND t.column_name = s.column_name
+            WHEN MATCHED THEN
+                UPDATE SET median = s.median, computed_at = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN
+                INSERT (table_name, column_name, median, computed_at)
+                VALUES (s.table_name, s.column_name, s.median, CURRENT_TIMESTAMP());"""
+        return declares, set_stmt
+
+    def build_clean_query(self, dataset_id: str, table_name: str, apply_global_median: bool = False):
+        """
+        Build the SELECT statement that produces the cleaned version of a table.
         
         Args:
             dataset_id (str): BigQuery dataset ID containing the source table
             table_name (str): Name of the source table to clean
-            destination_table (str): Full table ID for the cleaned destination table
             apply_global_median (bool): Whether to apply global median imputation for numeric columns
             
-        The method performs the following cleaning operations:
+        Returns:
+            str: SQL query returning the cleaned rows
+            
+        The generated query performs the following cleaning operations:
         - Removes duplicates using SELECT DISTINCT
         - Handles null values with appropriate defaults
         - Cleans and standardizes text fields
         - Flattens array columns for easier processing
         - Applies median imputation for specified numeric columns
+        
+        The query references the clean_arr temp function and, with apply_global_median,
+        variables declared by build_median_statements, so it must run inside the
+        clean_tables script.
         """
-        try:
-            self.logger.info(f"Starting cleaning for table: {dataset_id}.{table_name}")
-
-            # Get table schema information from BigQuery INFORMATION_SCHEMA
-            # This allows us to dynamically handle different table structures
-            columns_info = self.client.query(f"""
-                SELECT column_name, data_type
-                FROM `{self.project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMNS`
-                WHERE table_name = '{table_name}'
-                ORDER BY ordinal_position
-            """).to_dataframe(create_bqstorage_client=False)
-            self.logger.info(f"Retrieved {len(columns_info)} columns for table {table_name}")
-
-            # Categorize columns by data type for different cleaning strategies
-            array_cols = [row['column_name'] for _, row in columns_info.iterrows() if row['data_type'].startswith('ARRAY')]
-            string_cols = [row['column_name'] for _, row in columns_info.iterrows() if row['data_type'] in ('STRING', 'CHAR', 'TEXT')]
-            bool_cols = [row['column_name'] for _, row in columns_info.iterrows() if row['data_type'] == 'BOOL']
-
-            # Build SQL SELECT expressions for each column based on data type
-            # Each column gets appropriate cleaning logic based on its type
-            select_exprs = []
-            for _, row in columns_info.iterrows():
-                col = row['column_name']
-
-                # For numeric columns that need median imputation
-                if apply_global_median and col in self.median_numeric_cols:
-                    # Replace 0 values with NULL, then use global median as fallback
-                    select_exprs.append(
-                        f"COALESCE(NULLIF({col}, 0), global_medians.{col}_median) AS {col}"
-                    )
-                # For string columns: trim whitespace and replace empty strings with 'Unknown'
-                elif col in string_cols:
-                    select_exprs.append(f"COALESCE(NULLIF(TRIM({col}), ''), 'Unknown') AS {col}_clean")
-                # For boolean columns: replace NULL with FALSE
-                elif col in bool_cols:
-                    select_exprs.append(f"COALESCE({col}, FALSE) AS {col}")
-                # For array columns: flatten and convert to JSON strings, filtering out NULLs
-                elif col in array_cols:
-                    select_exprs.append(
-                        f"ARRAY(SELECT TO_JSON_STRING(x) FROM UNNEST({col}) AS x WHERE x IS NOT NULL) AS {col}_flat"
-                    )
-                # For other columns: keep as-is
-                else:
-                    select_exprs.append(col)
-
-            # Join all SELECT expressions with proper formatting
-            select_sql = ",\n  ".join(select_exprs)
-
-            # Build the final SQL query based on whether median imputation is needed
-            if apply_global_median:
-                # Query with global median calculation for numeric columns
-                # Uses CTEs to calculate medians across the entire dataset
-                query = f"""
-                WITH main AS (
-                    SELECT *
-                    FROM `{self.project_id}.{dataset_id}.{table_name}`
-                ),
-                global_medians AS (
-                    SELECT
-                        {', '.join([f'APPROX_QUANTILES(NULLIF({col}, 0), 2)[OFFSET(1)] AS {col}_median' for col in self.median_numeric_cols])}
-                    FROM main
+        # Get table schema information from BigQuery INFORMATION_SCHEMA
+        # This allows us to dynamically handle different table structures
+        # Column name -> data type in schema order
+        dtypes = self._get_columns_info(dataset_id, table_name)
+        self.logger.info(f"Retrieved {len(dtypes)} columns for table {table_name}")
+
+        # Categorize columns by data type for different cleaning strategies (sets for O(1) membership)
+        array_cols = {c for c, t in dtypes.items() if t.startswith('ARRAY')}
+        string_cols = {c for c, t in dtypes.items() if t in ('STRING', 'CHAR', 'TEXT')}
+        bool_cols = {c for c, t in dtypes.items() if t == 'BOOL'}
+        median_cols = set(self.median_numeric_cols) if apply_global_median else set()
+
+        # Build SQL SELECT expressions for each column based on data type
+        # Each column gets appropriate cleaning logic based on its type
+        select_exprs = []
+        for col in dtypes:
+
+            # For numeric columns that need median imputation
+            if col in median_cols:
+                # Replace 0 values with NULL, then use the global median variable as fallback
+                select_exprs.append(
+                    f"COALESCE(NULLIF({col}, 0), {self._median_var(table_name, col)}) AS {col}"
                 )
-                SELECT DISTINCT
-                {select_sql}
-                FROM main
-                LEFT JOIN global_medians ON TRUE
-                """
+            # For string columns: trim whitespace and replace empty strings with 'Unknown'
+            elif col in string_cols:
+                select_exprs.append(f"COALESCE(NULLIF(TRIM({col}), ''), 'Unknown') AS {col}_clean")
+            # For boolean columns: replace NULL with FALSE
+            elif col in bool_cols:
+                select_exprs.append(f"COALESCE({col}, FALSE) AS {col}")
+            # For array columns: flatten and convert to JSON strings, filtering out NULLs
+            elif col in array_cols:
+                select_exprs.append(f"clean_arr({col}) AS {col}_flat")
+            # For other columns: keep as-is
             else:
-                # Simple query without median imputation
-                query = f"""
-                SELECT DISTINCT
-                {select_sql}
-                FROM `{self.project_id}.{dataset_id}.{table_name}`
-                """
+                select_exprs.append(col)
+
+        # Join all SELECT expressions with proper formatting
+        select_sql = ",\n  ".join(select_exprs)
+
+        # Medians come from script variables (see build_median_statements), so no join is needed
+        return f"""
+            SELECT DISTINCT
+            {select_sql}
+            FROM `{self.project_id}.{dataset_id}.{table_name}`
+            """
+
+    def clean_table(self, dataset_id: str, table_name: str, destination_table: str, apply_global_median: bool = False):
+        """
+        Clean a BigQuery table by applying data cleaning transformations.
+        
+        Args:
+            dataset_id (str): BigQuery dataset ID containing the source table
+            table_name (str): Name of the source table to clean
+            destination_table (str): Full table ID for the cleaned destination table
+            apply_global_median (bool): Whether to apply global median imputation for numeric columns
+            
+        See build_clean_query for the cleaning operations applied.
+        """
+        self.clean_tables([{
+            "dataset_id": dataset_id,
+            "table_name": table_name,
+            "destination_table": destination_table,
+            "apply_global_median": apply_global_median
+        }])
+
+    def _build_table_statements(self, spec):
+        """
+        Build the script statements that clean a single table.
+        
+        Args:
+            spec (dict): Table spec as passed to clean_tables
+            
+        Returns:
+            tuple: (list of DECLARE statements, SET statement or None, CREATE OR REPLACE TABLE statement)
+        """
+        self.logger.info(f"Starting cleaning for table: {spec['dataset_id']}.{spec['table_name']}")
+        apply_global_median = spec.get("apply_global_median", False)
+        declares, set_stmt = [], None
+        if apply_global_median:
+            declares, set_stmt = self.build_median_statements(spec["dataset_id"], spec["table_name"])
+        select_sql = self.build_clean_query(spec["dataset_id"], spec["table_name"], apply_global_median)
 
-            # Execute the cleaning query and save results to destination table
-            self.logger.info(f"Executing cleaning query for {table_name}...")
-            job_config = bigquery.QueryJobConfig(
-                destination=destination_table,
-                write_disposition="WRITE_TRUNCATE"  # Overwrite existing table if it exists
-            )
-            self.client.query(query, job_config=job_config).result()
-            self.logger.info(f" Cleaned table saved: {destination_table}")
+        # Cluster the cleaned table on the keys downstream queries join and group by
+        cluster_sql = f" CLUSTER BY {', '.join(spec['cluster_by'])}" if spec.get("cluster_by") else ""
+        return declares, set_stmt, f"CREATE OR REPLACE TABLE `{spec['destination_table']}`{cluster_sql} AS\n{select_sql};"
+
+    def _fetch_sample(self, table_id: str):
+        """
+        Read a few rows of a table for logging.
+        
+        Args:
+            table_id (str): Full table ID to sample
+            
+        Returns:
+            str: Up to five rows, one dict per line, read with tabledata.list instead of a query job
+        """
+        # Five rows are only logged, so format them directly instead of building a DataFrame
+        return "\n".join(str(dict(row)) for row in self.client.list_rows(table_id, max_results=5))
+
+    def clean_tables(self, table_specs):
+        """
+        Clean several BigQuery tables with a single multi-statement script.
+        
+        Args:
+            table_specs (list): Dicts with dataset_id, table_name, destination_table,
+                apply_global_median and optional cluster_by (list of cleaned column
+                names) keys, one per table to clean
+                
+        Every table becomes one CREATE OR REPLACE TABLE statement in the same
+        script, so the cleaning pays for one job submission instead of one per table.
+        """
+        if not table_specs:
+            self.logger.warning("No tables to clean, skipping cleaning script")
+            return
+
+        try:
+            # Describe all tables of each dataset up front with one metadata query
+            tables_by_dataset = {}
+            for spec in table_specs:
+                tables_by_dataset.setdefault(spec["dataset_id"], []).append(spec["table_name"])
+            for dataset_id, table_names in tables_by_dataset.items():
+                self._load_schemas(dataset_id, table_names)
+
+            # Median lookups are independent per table, so prepare all tables concurrently
+            with ThreadPoolExecutor(max_workers=len(table_specs)) as executor:
+                prepared = list(executor.map(self._build_table_statements, table_specs))
+
+            # BigQuery requires every DECLARE to come before any other statement in a script
+            declares, sets, statements = [], [], []
+            for table_declares, set_stmt, create_stmt in prepared:
+                declares.extend(table_declares)
+                if set_stmt:
+                    sets.append(set_stmt)
+                statements.append(create_stmt)
+
+            # Submit all cleaning statements as one BigQuery script
+            self.logger.info(f"Executing cleaning script for {len(statements)} tables...")
+            self.client.query("\n".join(declares + [self._CLEAN_ARRAY_UDF] + sets + statements)).result()
+            for spec in table_specs:
+                self.logger.info(f" Cleaned table saved: {spec['destination_table']}")
 
         except Exception as e:
             # Log any errors that occur during the cleaning process
-            self.logger.error(f"Error cleaning table {dataset_id}.{table_name}: {e}", exc_info=True)
+            self.logger.error(f"Error running cleaning script: {e}", exc_info=True)
 
     def run(self):
         """
@@ -172,47 +465,51 @@ class DataCleaning:
         self.logger.info(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         self.logger.info("=" * 60)
         
-        # Clean books table with global median imputation for numeric columns
-        # This helps handle missing publication years and page counts
-        self.clean_table(
-            dataset_id="books",
-            table_name="goodreads_books_mystery_thriller_crime",
-            destination_table=f"{self.project_id}.books.goodreads_books_cleaned_staging",
-            apply_global_median=True  # Apply median imputation for publication_year and num_pages
-        )
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            # Create author gender mapping for bias analysis
+            # It only reads the authors table, so it runs while the cleaning script executes
+            gender_future = executor.submit(self.create_author_gender_map)
 
-        # Clean interactions table without median imputation
-        # Interactions data typically doesn't need median imputation
-        self.clean_table(
-            dataset_id="books",
-            table_name="goodreads_interactions_mystery_thriller_crime",
-            destination_table=f"{self.project_id}.books.goodreads_interactions_cleaned_staging",
-            apply_global_median=False
-        )
+            # Clean books and interactions tables in one BigQuery script
+            # Books use global median imputation to handle missing publication years and page counts;
+            # interactions data typically doesn't need median imputation
+            self.clean_tables([
+                {
+                    "dataset_id": "books",
+                    "table_name": "goodreads_books_mystery_thriller_crime",
+                    "destination_table": f"{self.project_id}.books.goodreads_books_cleaned_staging",
+                    "apply_global_median": True,
+                    "cluster_by": ["book_id"]
+                },
+                {
+                    "dataset_id": "books",
+                    "table_name": "goodreads_interactions_mystery_thriller_crime",
+                    "destination_table": f"{self.project_id}.books.goodreads_interactions_cleaned_staging",
+                    "apply_global_median": False,
+                    "cluster_by": ["user_id_clean", "book_id"]
+                }
+            ])
 
-        # Fetch and log sample rows from cleaned tables for verification
-        try:
-            # Get sample data from cleaned books table
-            df_books_sample = self.client.query(
-                f"SELECT * FROM `{self.project_id}.books.goodreads_books_cleaned_staging` LIMIT 5"
-            ).to_dataframe(create_bqstorage_client=False)
-
-            # Get sample data from cleaned interactions table
-            df_interactions_sample = self.client.query(
-                f"SELECT * FROM `{self.project_id}.books.goodreads_interactions_cleaned_staging` LIMIT 5"
-            ).to_dataframe(create_bqstorage_client=False)
-
-            # Log sample data for verification
-            self.logger.info("Books sample:")
-            self.logger.info("\n%s", df_books_sample)
-            self.logger.info("Interactions sample:")
-            self.logger.info("\n%s", df_interactions_sample)
-        except Exception as e:
-            self.logger.error(f"Error fetching sample data: {e}", exc_info=True)
-            print("Books sample:")
-            
-        # Create author gender mapping for bias analysis
-        self.create_author_gender_map()
+            # Fetch and log sample rows from cleaned tables for verification
+            try:
+                # Fetch both samples concurrently
+                books_future = executor.submit(
+                    self._fetch_sample, f"{self.project_id}.books.goodreads_books_cleaned_staging"
+                )
+                interactions_future = executor.submit(
+                    self._fetch_sample, f"{self.project_id}.books.goodreads_interactions_cleaned_staging"
+                )
+
+                # Log sample data for verification
+                self.logger.info("Books sample:")
+                self.logger.info("\n%s", books_future.result())
+                self.logger.info("Interactions sample:")
+                self.logger.info("\n%s", interactions_future.result())
+            except Exception as e:
+                self.logger.error(f"Error fetching sample data: {e}", exc_info=True)
+
+            # create_author_gender_map logs its own errors; wait for it before reporting completion
+            gender_future.result()
         
         # Log pipeline completion statistics
         end_time = time.time()
@@ -221,67 +518,76 @@ class DataCleaning:
         self.logger.info(f"Total runtime: {(end_time - start_time):.2f} seconds")
         self.logger.info("=" * 60)
 
+    def _ensure_gender_lookup_table(self):
+        """
+        Make sure the first name -> gender lookup table exists in BigQuery.
+        
+        Returns:
+            str: Full table ID of the lookup table
+            
+        The table holds gender-guesser's whole name dictionary, so it only depends
+        on the library and is uploaded once, on the first run that finds it missing.
+        """
+        lookup_table_id = f"{self.project_id}.books.name_gender_lookup"
+        try:
+            self.client.get_table(lookup_table_id)
+            return lookup_table_id
+        except NotFound:
+            self.logger.info(f"Lookup table {lookup_table_id} not found, uploading it...")
+
+        # Only Male/Female names are stored; anything missing from the lookup maps to 'Unknown'
+        lookup_df = pd.DataFrame(
+            [(name, gender) for name, gender in _gender_lookup().items() if gender != "Unknown"],
+            columns=["first_name", "gender"]
+        )
+        job_config = bigquery.LoadJobConfig(
+            write_disposition="WRITE_TRUNCATE",
+            source_format=bigquery.SourceFormat.PARQUET  # Serialize through pyarrow rather than CSV
+        )
+        job = self.client.load_table_from_dataframe(lookup_df, lookup_table_id, job_config=job_config)
+        job.result()  # Wait for upload to complete
+        self.logger.info(f"Uploaded {len(lookup_df)} rows to {lookup_table_id}")
+        return lookup_table_id
+
     def create_author_gender_map(self):
         """
         Generate and upload author gender mapping table to BigQuery.
         
         This method creates a gender mapping for authors to support bias analysis
         in the recommendation system. It uses the gender-guesser library to infer
-        gender from author names and stores the results in BigQuery.
+        gender from author first names and stores the results in BigQuery.
+        
+        The gender-guesser dictionary lives in BigQuery as a lookup table, so the
+        mapping is a single join inside the warehouse and no author data is
+        downloaded or classified in Python.
         
         The gender mapping is used later in the bias analysis pipeline to ensure
         fair recommendations across different author demographics.
         """
         try:
             self.logger.info("Starting gender mapping for authors...")
+            lookup_table_id = self._ensure_gender_lookup_table()
 
-            # Load authors table from BigQuery using dynamic project ID
-            query = f"""
-                SELECT author_id, name
-                FROM `{self.project_id}.books.goodreads_book_authors`
-                WHERE name IS NOT NULL
-            """
-            authors_df = self.client.query(query).to_dataframe(create_bqstorage_client=False)
-            self.logger.info(f"Retrieved {len(authors_df)} author rows.")
-
-            # Initialize gender detector with case-insensitive matching
-            detector = Detector(case_sensitive=False)
+            # First name = first whitespace-separated token, lowercased to match the lookup;
+            # names with periods (initials) are skipped
+            first_name_expr = r"LOWER(REGEXP_EXTRACT(a.name, r'^\s*(\S+)'))"
 
-            def get_gender(name):
-                """
-                Infer gender from author name using gender-guesser library.
-                
-                Args:
-                    name (str): Author's full name
-                    
-                Returns:
-                    str: 'Male', 'Female', or 'Unknown'
-                """
-                # Handle edge cases: empty names, names with periods, or single characters
-                if not name or '.' in name or len(name.split()) == 0:
-                    return "Unknown"
-                    
-                # Use first name for gender inference
-                g = detector.get_gender(name.split()[0])
-                
-                # Map gender-guesser results to our categories
-                if g in ["male", "mostly_male"]:
-                    return "Male"
-                elif g in ["female", "mostly_female"]:
-                    return "Female"
-                else:
-                    return "Unknown"
-
-            tqdm.pandas(desc="Inferring author gender", file=sys.stdout)
-            authors_df["author_gender_group"] = authors_df["name"].progress_apply(get_gender)
-
-            # Upload gender mapping back to BigQuery
+            # Join the lookup to every author server-side
             table_id = f"{self.project_id}.books.goodreads_author_gender_map"
-            job_config = bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE")
-            job = self.client.load_table_from_dataframe(authors_df, table_id, job_config=job_config)
-            job.result()  # Wait for upload to complete
-            self.logger.info(f"Uploaded {len(authors_df)} rows to {table_id}")
-            self.logger.info("Uploaded gender map to books.goodreads_author_gender_map")
+            map_query = f"""
+                CREATE OR REPLACE TABLE `{table_id}` AS
+                SELECT
+                    a.author_id,
+                    a.name,
+                    COALESCE(g.gender, 'Unknown') AS author_gender_group
+                FROM `{self.project_id}.books.goodreads_book_authors` a
+                LEFT JOIN `{lookup_table_id}` g
+                    ON STRPOS(a.name, '.') = 0
+                    AND {first_name_expr} = g.first_name
+                WHERE a.name IS NOT NULL
+            """
+            self.client.query(map_query).result()
+            self.logger.info("Created gender map books.goodreads_author_gender_map")
 
         except Exception as e:
             self.logger.error(f"Error creating author gender map: {e}", exc_info=True)
@@ -295,7 +601,11 @@ def main():
     It creates a DataCleaning instance and runs the complete cleaning process.
     """
     data_cleaner = DataCleaning()
-    data_cleaner.run()
+    try:
+        data_cleaner.run()
+    finally:
+        # Release BigQuery connections when the task finishes
+        close_client()
 
 if __name__ == "__main__":
     # Allow the script to be run directly for testing or development
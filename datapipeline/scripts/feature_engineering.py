@@ -20,6 +20,7 @@ import os
 from google.cloud import bigquery
 from datetime import datetime
 from datapipeline.scripts.logger_setup import get_logger
+from datapipeline.scripts.bq_client import get_client, close_client
 import time
 
 class FeatureEngineering:
@@ -43,7 +44,7 @@ class FeatureEngineering:
         self.logger = get_logger("feature_engineering")
 
         # Initialize BigQuery client and get project information
-        self.client = bigquery.Client()
+        self.client = get_client()
         self.project_id = self.client.project
         self.dataset_id = "books"
 
@@ -341,7 +342,12 @@ class FeatureEngineering:
               INNER JOIN book_final b ON i.book_id = b.book_id
             )
 
-            SELECT * FROM merged
+            SELECT
+              *,
+              -- Stable per-user bucket (0-99) used by the train/val/test split;
+              -- masking the sign bit keeps it non-negative without ABS, which overflows on INT64 min
+              MOD(FARM_FINGERPRINT(CAST(user_id_clean AS STRING)) & 0x7FFFFFFFFFFFFFFF, 100) AS _split_bucket
+            FROM merged
             WHERE 
               num_books_read > 0
               AND ratings_count > 0
@@ -353,7 +359,8 @@ class FeatureEngineering:
             # Execute the feature engineering query and save results
             job_config = bigquery.QueryJobConfig(
                 destination=self.destination_table,
-                write_disposition="WRITE_TRUNCATE"  # Overwrite existing table if it exists
+                write_disposition="WRITE_TRUNCATE",  # Overwrite existing table if it exists
+                clustering_fields=["_split_bucket"]  # Lets split queries prune by bucket range
             )
 
             self.logger.info("Executing feature engineering query...")
@@ -390,28 +397,30 @@ class FeatureEngineering:
             FROM `{self.destination_table}`
             """
 
-            stats = self.client.query(stats_query).to_dataframe(create_bqstorage_client=False)
+            # The aggregate is a single row, so read it directly instead of building a DataFrame
+            stats = next(iter(self.client.query(stats_query).result()))
             
             # Log comprehensive statistics
             self.logger.info("Table Statistics:")
-            self.logger.info(f"Total rows: {stats['total_rows'].iloc[0]:,}")
-            self.logger.info(f"Unique users: {stats['unique_users'].iloc[0]:,}")
-            self.logger.info(f"Unique books: {stats['unique_books'].iloc[0]:,}")
-            self.logger.info(f"Avg books per user: {stats['avg_books_per_user'].iloc[0]}")
-            self.logger.info(f"Avg reading time (days): {stats['avg_reading_time_days'].iloc[0]}")
-            self.logger.info(f"Avg pages: {stats['avg_pages'].iloc[0]}")
-            self.logger.info(f"Avg rating: {stats['avg_rating'].iloc[0]}")
+            self.logger.info(f"Total rows: {stats['total_rows']:,}")
+            self.logger.info(f"Unique users: {stats['unique_users']:,}")
+            self.logger.info(f"Unique books: {stats['unique_books']:,}")
+            self.logger.info(f"Avg books per user: {stats['avg_books_per_user']}")
+            self.logger.info(f"Avg reading time (days): {stats['avg_reading_time_days']}")
+            self.logger.info(f"Avg pages: {stats['avg_pages']}")
+            self.logger.info(f"Avg rating: {stats['avg_rating']}")
 
             # Perform basic data anomaly detection
-            if stats['total_rows'].iloc[0] == 0:
+            if stats['total_rows'] == 0:
                 self.logger.warning(
                     "Anomaly Detected: No rows found in the final features table!")
 
-            if stats['avg_rating'].iloc[0] < 1.0 or stats['avg_rating'].iloc[0] > 5.0:
+            # AVG is NULL on an empty table, which the row-count check already reports
+            if stats['avg_rating'] is not None and not 1.0 <= stats['avg_rating'] <= 5.0:
                 self.logger.warning(
                     "Anomaly Detected: Average rating is outside the expected range (1–5).")
 
-            if stats['unique_users'].iloc[0] < 1:
+            if stats['unique_users'] < 1:
                 self.logger.warning(
                     "Anomaly Detected: Very few unique users found — potential data loss.")
 
@@ -504,7 +513,11 @@ def main():
     It creates a FeatureEngineering instance and runs the complete feature creation process.
     """
     feature_engineer = FeatureEngineering()
-    feature_engineer.run()
+    try:
+        feature_engineer.run()
+    finally:
+        # Release BigQuery connections when the task finishes
+        close_client()
 
 
 if __name__ == "__main__":
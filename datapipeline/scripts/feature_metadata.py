@@ -20,7 +20,7 @@ import os
 import json
 from datetime import datetime
 from datapipeline.scripts.logger_setup import get_logger
-from google.cloud import bigquery
+from datapipeline.scripts.bq_client import get_client, close_client
 
 class FeatureMetadata:
 
@@ -42,7 +42,7 @@ class FeatureMetadata:
         self.logger = get_logger("feature_metadata")
 
         # Initialize BigQuery client and get project information
-        self.client = bigquery.Client()
+        self.client = get_client()
         self.project_id = self.client.project
         self.dataset_id = "books"
 
@@ -53,36 +53,35 @@ class FeatureMetadata:
         This method extracts comprehensive metadata including:
         - Table schema information (column names, types, modes)
         - Row count and data statistics
-        - Timestamp and query hash for tracking
+        - Timestamp for tracking
         - Saves metadata to JSON file for DVC integration
         """
         try:
             self.logger.info("Starting feature metadata collection")
             print("Starting feature metadata collection")
             
-            # Query to get row count from the features table
-            query = f"SELECT COUNT(*) FROM `{self.project_id}.{self.dataset_id}.goodreads_features`"
-            job = self.client.query(query)
-
-            # Get table schema information from BigQuery
+            # Get table schema and row count from BigQuery table metadata (no scan)
             table = self.client.get_table(f"{self.project_id}.{self.dataset_id}.goodreads_features")
+            # _split_bucket is internal to the train/val/test split and is not a feature
             schema = [
                 {"name": field.name, "type": field.field_type, "mode": field.mode}
                 for field in table.schema
+                if field.name != "_split_bucket"
             ]
 
             # Record current timestamp for metadata
             timestamp = datetime.now()
 
-            # Get row count from query result
-            row_count = job.to_dataframe(create_bqstorage_client=False).iloc[0, 0]
+            # Row count from table metadata, plus any rows still in the streaming buffer
+            row_count = table.num_rows
+            if row_count is not None and table.streaming_buffer is not None:
+                row_count += table.streaming_buffer.estimated_rows or 0
 
             # Create comprehensive metadata dictionary
             metadata = {
                 "table": f"{self.dataset_id}.goodreads_features",
                 "schema": schema,
                 "row_count": int(row_count) if row_count is not None else None,
-                "query_hash": hash(query),  # Hash of the query for tracking changes
                 "timestamp": timestamp.isoformat()
             }
 
@@ -105,7 +104,11 @@ def main():
     It creates a FeatureMetadata instance and runs the metadata collection pipeline.
     """
     feature_metadata = FeatureMetadata()
-    feature_metadata.run()
+    try:
+        feature_metadata.run()
+    finally:
+        # Release BigQuery connections when the task finishes
+        close_client()
 
 if __name__ == "__main__":
     # Allow the script to be run directly for testing or development
@@ -6,7 +6,7 @@ It creates persistent log files that survive Airflow reruns and provides both
 file and console logging with consistent formatting.
 
 Key Features:
-- Creates persistent log files in the logs/ directory
+- Creates persistent, size-rotated log files in the logs/ directory
 - Avoids duplicate handlers when DAGs are re-imported
 - Provides both file and console logging (console disabled in Airflow)
 - Consistent formatting across all pipeline components
@@ -17,8 +17,14 @@ Date: 2025
 """
 
 import logging
+import logging.handlers
 import os
+from functools import lru_cache
 
+# Log directory is resolved once, at import time
+LOG_DIR = os.path.join(os.getcwd(), "logs")
+
+@lru_cache(maxsize=None)
 def get_logger(name):
     """
     Create and configure a logger for the specified component.
@@ -31,21 +37,24 @@ def get_logger(name):
         
     This function creates a logger with both file and console handlers (when not in Airflow),
     ensuring logs are persistent and properly formatted. It avoids duplicate handlers
-    when DAGs are re-imported by checking existing handlers.
+    when DAGs are re-imported by checking existing handlers. Loggers are cached per name,
+    so repeated calls return immediately without touching the filesystem.
     """
-    # Create logs directory if it doesn't exist
-    log_dir = os.path.join(os.getcwd(), "logs")
-    os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, f"{name}.log")
-
     # Create logger instance
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
 
     # Avoid duplicate handlers if DAG is re-imported
     if not logger.handlers:
-        # Create file handler for persistent logging
-        file_handler = logging.FileHandler(log_file)
+        # Create logs directory if it doesn't exist
+        os.makedirs(LOG_DIR, exist_ok=True)
+        log_file = os.path.join(LOG_DIR, f"{name}.log")
+
+        # Create rotating file handler for persistent logging
+        # delay=True defers opening the file until the first record is written
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=10 * 1024 * 1024, backupCount=5, delay=True
+        )
         formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
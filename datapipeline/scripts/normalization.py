@@ -15,9 +15,9 @@ Date: 2025
 """
 
 import os
-from google.cloud import bigquery
 from datetime import datetime
 from datapipeline.scripts.logger_setup import get_logger
+from datapipeline.scripts.bq_client import get_client, close_client
 import time
 
 class GoodreadsNormalization:
@@ -40,7 +40,7 @@ class GoodreadsNormalization:
         self.logger = get_logger("normalization")
 
         # Initialize BigQuery client and get project information
-        self.client = bigquery.Client()
+        self.client = get_client()
         self.project_id = self.client.project
         self.dataset_id = "books"
         
@@ -162,7 +162,11 @@ def main():
     It creates a GoodreadsNormalization instance and runs the complete normalization process.
     """
     normalizer = GoodreadsNormalization()
-    normalizer.run()
+    try:
+        normalizer.run()
+    finally:
+        # Release BigQuery connections when the task finishes
+        close_client()
 
 if __name__ == "__main__":
     # Allow the script to be run directly for testing or development
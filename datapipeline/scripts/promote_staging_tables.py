@@ -16,8 +16,9 @@ Date: 2025
 """
 
 import os
-from google.cloud import bigquery
+from concurrent.futures import ThreadPoolExecutor
 from datapipeline.scripts.logger_setup import get_logger
+from datapipeline.scripts.bq_client import get_client, close_client
 
 class StagingTablePromoter:
 
@@ -39,50 +40,69 @@ class StagingTablePromoter:
         self.logger = get_logger("promote_staging_tables")
 
         # Initialize BigQuery client and get project information
-        self.client = bigquery.Client()
+        self.client = get_client()
         self.project_id = self.client.project
         self.dataset_id = "books"
     
+    def _promote_one(self, staging_table, prod_table):
+        """
+        Promote a single staging table to production and drop the staging table.
+        
+        Args:
+            staging_table (str): Name of the staging table
+            prod_table (str): Name of the production table to replace
+        """
+        self.logger.info(f"Promoting {staging_table} to {prod_table}...")
+        staging_ref = f"{self.project_id}.{self.dataset_id}.{staging_table}"
+        prod_ref = f"{self.project_id}.{self.dataset_id}.{prod_table}"
+
+        # Replace production table with a copy of the staging table
+        # Same-region table copies are metadata-only, so no data is scanned or billed;
+        # CREATE OR REPLACE also takes over the staging clustering, which a WRITE_TRUNCATE
+        # copy job into an existing table with a different clustering spec would reject
+        self.client.query(f"CREATE OR REPLACE TABLE `{prod_ref}` COPY `{staging_ref}`").result()
+        self.logger.info(f"Successfully promoted {staging_table} to {prod_table}.")
+
+        # Remove staging table after successful promotion
+        self.logger.info(f"Dropping staging table: {staging_table}...")
+        self.client.delete_table(staging_ref)
+        self.logger.info(f"Successfully dropped staging table: {staging_table}.")
+
     def promote_staging_tables(self):
         """
         Promote staging tables to production by replacing the production tables.
         
         This method performs the following operations for each staging table:
-        1. Creates or replaces the production table with staging data
+        1. Replaces the production table with a copy of the staging table
         2. Drops the staging table after successful promotion
         
-        The promotion ensures a clean transition from staging to production
-        environment with proper cleanup of temporary staging tables.
+        The tables are independent, so they are promoted concurrently on the shared
+        BigQuery client. Every promotion runs to completion; if any of them fails the
+        errors are logged and the first one is re-raised.
         """
-        try:
-            # Define mapping of staging tables to production tables
-            staging_tables = {
-                "goodreads_books_cleaned_staging": "goodreads_books_cleaned",
-                "goodreads_interactions_cleaned_staging": "goodreads_interactions_cleaned",
-                "goodreads_features_cleaned_staging": "goodreads_features"
+        # Define mapping of staging tables to production tables
+        staging_tables = {
+            "goodreads_books_cleaned_staging": "goodreads_books_cleaned",
+            "goodreads_interactions_cleaned_staging": "goodreads_interactions_cleaned",
+            "goodreads_features_cleaned_staging": "goodreads_features"
+        }
+
+        # Promote each staging table to production
+        with ThreadPoolExecutor(max_workers=len(staging_tables)) as executor:
+            futures = {
+                staging_table: executor.submit(self._promote_one, staging_table, prod_table)
+                for staging_table, prod_table in staging_tables.items()
             }
 
-            # Promote each staging table to production
-            for staging_table, prod_table in staging_tables.items():
-                self.logger.info(f"Promoting {staging_table} to {prod_table}...")
-                
-                # Create or replace production table with staging data
-                query = f"""
-                CREATE OR REPLACE TABLE `{self.project_id}.{self.dataset_id}.{prod_table}` AS
-                SELECT * FROM `{self.project_id}.{self.dataset_id}.{staging_table}`;
-                """
-                self.client.query(query).result()
-                self.logger.info(f"Successfully promoted {staging_table} to {prod_table}.")
-            
-                # Remove staging table after successful promotion
-                self.logger.info(f"Dropping staging table: {staging_table}...")
-                drop_query = f"DROP TABLE `{self.project_id}.{self.dataset_id}.{staging_table}`;"
-                self.client.query(drop_query).result()
-                self.logger.info(f"Successfully dropped staging table: {staging_table}.")
-
-        except Exception as e:
-            self.logger.error("Error promoting staging tables.", exc_info=True)
-            raise
+        errors = []
+        for staging_table, future in futures.items():
+            error = future.exception()
+            if error is not None:
+                self.logger.error(f"Error promoting staging table {staging_table}.", exc_info=error)
+                errors.append(error)
+
+        if errors:
+            raise errors[0]
 
     def run(self):
         """
@@ -101,7 +121,11 @@ def main():
     It creates a StagingTablePromoter instance and runs the promotion pipeline.
     """
     promoter = StagingTablePromoter()
-    promoter.run()
+    try:
+        promoter.run()
+    finally:
+        # Release BigQuery connections when the task finishes
+        close_client()
 
 if __name__ == "__main__":
     # Allow the script to be run directly for testing or development
@@ -1,15 +1,24 @@
 import os
-from google.cloud import bigquery
+import string
 from datapipeline.scripts.logger_setup import get_logger
+from datapipeline.scripts.bq_client import get_client, close_client
 
 class GoodreadsNormalizedSplitter:
 
+    # Statement writing one split table from a range of the features table's per-user buckets (0-99)
+    _SPLIT_QUERY = string.Template("""
+            CREATE OR REPLACE TABLE `$table`
+            CLUSTER BY user_id_clean, book_id AS
+            SELECT * EXCEPT(_split_bucket) FROM `$source`
+            WHERE _split_bucket $bucket_range
+            """)
+
     def __init__(self):
 
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.environ.get("AIRFLOW_HOME") + "/gcp_credentials.json"
         
         self.logger = get_logger("normalized_split")
-        self.client = bigquery.Client()
+        self.client = get_client()
         self.project_id = self.client.project
         self.dataset_id = "books"
 
@@ -20,40 +29,38 @@ class GoodreadsNormalizedSplitter:
         self.test_table = f"{self.project_id}.{self.dataset_id}.goodreads_test_set"
 
     def run_split_in_bq(self, train_ratio=0.7, val_ratio=0.15, test_ratio=0.15):
-        """Split data into train/validation/test in BigQuery using user_id_clean column."""
+        """Split data into train/validation/test in BigQuery using user_id_clean column.
+
+        Each user's bucket is hashed from user_id_clean once, by feature engineering, and
+        stored as _split_bucket, so all of a user's interactions land in the same split and
+        no split query hashes rows. The split tables leave the column out.
+        The three split jobs are independent and are submitted before waiting on any of them.
+        Split tables are clustered on user_id_clean, book_id for downstream lookups and joins.
+        """
 
         self.logger.info("Starting BigQuery-based data split...")
 
-        # Train
-        train_query = f"""
-        CREATE OR REPLACE TABLE `{self.train_table}` AS
-        SELECT *
-        FROM `{self.source_table}`
-        WHERE MOD(ABS(FARM_FINGERPRINT(CAST(user_id_clean AS STRING))), 100) < {int(train_ratio*100)};
-        """
-        self.client.query(train_query).result()
-        self.logger.info(f"Train table created: {self.train_table}")
-
-        # Validation
-        val_query = f"""
-        CREATE OR REPLACE TABLE `{self.val_table}` AS
-        SELECT *
-        FROM `{self.source_table}`
-        WHERE MOD(ABS(FARM_FINGERPRINT(CAST(user_id_clean AS STRING))), 100)
-              BETWEEN {int(train_ratio*100)} AND {int((train_ratio+val_ratio)*100)-1};
-        """
-        self.client.query(val_query).result()
-        self.logger.info(f"Validation table created: {self.val_table}")
-
-        # Test
-        test_query = f"""
-        CREATE OR REPLACE TABLE `{self.test_table}` AS
-        SELECT *
-        FROM `{self.source_table}`
-        WHERE MOD(ABS(FARM_FINGERPRINT(CAST(user_id_clean AS STRING))), 100) >= {int((train_ratio+val_ratio)*100)};
-        """
-        self.client.query(test_query).result()
-        self.logger.info(f"Test table created: {self.test_table}")
+        # Bucket boundaries (0-99) for each split
+        train_end = int(train_ratio*100)
+        val_end = int((train_ratio+val_ratio)*100)
+
+        splits = [
+            ("Train", self.train_table, f"< {train_end}"),
+            ("Validation", self.val_table, f"BETWEEN {train_end} AND {val_end-1}"),
+            ("Test", self.test_table, f">= {val_end}"),
+        ]
+
+        # Submit all jobs first so they run in parallel on the BigQuery side
+        jobs = []
+        for name, table, bucket_range in splits:
+            query = self._SPLIT_QUERY.substitute(table=table, source=self.source_table, bucket_range=bucket_range)
+            job = self.client.query(query)
+            self.logger.info(f"{name} split job submitted: {job.job_id}")
+            jobs.append((name, table, job))
+
+        for name, table, job in jobs:
+            job.result()
+            self.logger.info(f"{name} table created: {table}")
 
         self.logger.info("BigQuery-based split completed successfully.")
 
@@ -63,7 +70,11 @@ class GoodreadsNormalizedSplitter:
 
 def main():
     splitter = GoodreadsNormalizedSplitter()
-    splitter.run()
+    try:
+        splitter.run()
+    finally:
+        # Release BigQuery connections when the task finishes
+        close_client()
 
 
 if __name__ == "__main__":
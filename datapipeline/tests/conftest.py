@@ -0,0 +1,53 @@
+"""
+Shared pytest fixtures for the data pipeline tests.
+
+Author: Goodreads Recommendation Team
+Date: 2025
+"""
+
+import pytest
+from unittest.mock import Mock
+from datapipeline.scripts import bq_client
+from datapipeline.tests.helpers import make_client_mock
+
+
+@pytest.fixture(autouse=True)
+def reset_bq_client():
+    """
+    Reset the shared BigQuery client around every test.
+
+    Each test patches bigquery.Client with its own mock, so a client cached
+    by an earlier test must not be handed to the next one.
+    """
+    bq_client.reset_client()
+    yield
+    bq_client.reset_client()
+
+
+@pytest.fixture(autouse=True)
+def mock_bq_client_class(request, monkeypatch):
+    """
+    Install a factory of mocked clients as bigquery.Client for every unit test.
+
+    All pipeline modules create their client through bq_client, so this single
+    patch keeps unit tests off real GCP. Each call builds a fresh mock, and tests
+    marked integration keep the real client.
+    """
+    if request.node.get_closest_marker("integration"):
+        return None
+    factory = Mock(side_effect=lambda *args, **kwargs: make_client_mock())
+    monkeypatch.setattr(bq_client.bigquery, "Client", factory)
+    return factory
+
+
+@pytest.fixture
+def bq_mocks():
+    """
+    Get the mocked shared BigQuery client the code under test will receive.
+
+    Returns:
+        tuple: (mock_client, mock_query_job), where every client.query call
+            returns mock_query_job and its result() returns None
+    """
+    mock_client = bq_client.get_client()
+    return mock_client, mock_client.query.return_value
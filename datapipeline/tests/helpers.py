@@ -0,0 +1,42 @@
+"""
+Shared mock builders and assertion helpers for the data pipeline tests.
+
+Author: Goodreads Recommendation Team
+Date: 2025
+"""
+
+from unittest.mock import Mock
+from google.cloud import bigquery
+
+# Real classes captured at import, before bigquery.Client is patched for each test
+_CLIENT_SPEC = bigquery.Client
+_QUERY_JOB_SPEC = bigquery.QueryJob
+
+
+def make_client_mock():
+    """
+    Build a mocked BigQuery client whose query() returns a mocked job.
+
+    Returns:
+        Mock: Client specced to bigquery.Client; result() on its jobs returns None
+    """
+    # Specced mocks only expose real Client/QueryJob attributes, so misspelled calls fail
+    mock_query_job = Mock(spec=_QUERY_JOB_SPEC)
+    mock_query_job.result.return_value = None
+    mock_client = Mock(spec=_CLIENT_SPEC)
+    mock_client.query.return_value = mock_query_job
+    mock_client.project = "test_project"
+    return mock_client
+
+
+def queries_of(mock_client):
+    """
+    Get the SQL text of every query submitted to a mocked client, in call order.
+
+    Args:
+        mock_client (Mock): Mocked BigQuery client
+
+    Returns:
+        list: First positional argument of each client.query call
+    """
+    return [c.args[0] for c in mock_client.query.call_args_list]
@@ -0,0 +1,206 @@
+"""
+Unit Tests for Anomaly Detection Module
+
+This module contains unit tests for the AnomalyDetection class, testing the
+fused validation queries, the post-validation marker and failure handling.
+
+Test Coverage:
+- Fused validation result parsing and thresholds
+- Post-validation skip for unchanged cleaned tables
+- Marker writes after successful validation
+- Failure emails on a background thread
+- Shared BigQuery client shutdown
+
+Author: Goodreads Recommendation Team
+Date: 2025
+"""
+
+import json
+import logging
+import sys
+import threading
+import types
+import pytest
+from unittest.mock import Mock, patch
+
+try:
+    import airflow.utils.email  # noqa: F401
+except ImportError:
+    # Airflow is only installed in the DAG image; stub the one function anomaly_detection imports
+    _email_module = types.ModuleType("airflow.utils.email")
+    _email_module.send_email = Mock()
+    sys.modules.setdefault("airflow", types.ModuleType("airflow"))
+    sys.modules.setdefault("airflow.utils", types.ModuleType("airflow.utils"))
+    sys.modules["airflow.utils.email"] = _email_module
+
+from datapipeline.scripts import anomaly_detection, bq_client
+from datapipeline.scripts.anomaly_detection import AnomalyDetection
+
+
+@pytest.fixture(autouse=True)
+def set_env(tmp_path, monkeypatch):
+    """
+    Point AIRFLOW_HOME at a temporary directory so the marker file stays local to each test.
+    """
+    monkeypatch.setenv("AIRFLOW_HOME", str(tmp_path))
+    # Registered so the credentials path set by __init__ is restored after the test
+    monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS", raising=False)
+
+
+@pytest.fixture
+def detector(bq_mocks):
+    """
+    Create AnomalyDetection instance with the shared mocked BigQuery client.
+
+    Returns:
+        AnomalyDetection: Instance with a mocked logger
+    """
+    ad = AnomalyDetection()
+    ad.logger = Mock(spec=logging.Logger)
+    return ad
+
+
+def set_rows(mock_client, rows):
+    """Make every query on the mocked client return the given result rows."""
+    mock_client.query.return_value.result.return_value = rows
+
+
+def test_fused_validation_passes(detector, bq_mocks):
+    """Ensure a non-empty table with no violations passes in a single query."""
+    mock_client, _ = bq_mocks
+    set_rows(mock_client, [{"row_count": 10, "null_book_id": 0, "null_title": 0}])
+
+    passed = detector.run_fused_validation(
+        "goodreads_books_mystery_thriller_crime", "Books",
+        AnomalyDetection._BOOKS_SOURCE_SQL, {"null_book_id": 0, "null_title": 0}
+    )
+
+    assert passed
+    mock_client.query.assert_called_once()
+    query = mock_client.query.call_args.args[0]
+    assert "COUNTIF(book_id IS NULL) AS null_book_id" in query
+    assert "test_project.books.goodreads_books_mystery_thriller_crime" in query
+    detector.logger.error.assert_not_called()
+
+
+def test_fused_validation_reports_violations(detector, bq_mocks):
+    """Ensure counters above their thresholds fail validation and are logged."""
+    mock_client, _ = bq_mocks
+    set_rows(mock_client, [{"row_count": 10, "null_user_id": 0, "null_book_id": 3, "invalid_rating": 0}])
+
+    passed = detector.run_fused_validation(
+        "goodreads_interactions_cleaned_staging", "Interactions",
+        AnomalyDetection._INTERACTIONS_CLEANED_SQL,
+        {"null_user_id": 0, "null_book_id": 0, "invalid_rating": 0}
+    )
+
+    assert not passed
+    error_message = detector.logger.error.call_args.args[0]
+    # Only the counters over their threshold are reported as violations
+    assert error_message.endswith('{"null_book_id": 3}')
+
+
+def test_fused_validation_fails_on_empty_table(detector, bq_mocks):
+    """Ensure an empty table fails before violation counts are evaluated."""
+    mock_client, _ = bq_mocks
+    set_rows(mock_client, [{"row_count": 0, "null_book_id": 0, "null_title": 0}])
+
+    passed = detector.run_fused_validation(
+        "goodreads_books_mystery_thriller_crime", "Books",
+        AnomalyDetection._BOOKS_SOURCE_SQL, {"null_book_id": 0, "null_title": 0}
+    )
+
+    assert not passed
+    detector.logger.error.assert_called_once_with("Books table is empty")
+
+
+def test_validate_data_quality_failure_sends_email(detector):
+    """Ensure any failed table check raises and sends a failure email."""
+    with patch.object(detector, "validate_books_with_bigquery", return_value=True), \
+         patch.object(detector, "validate_interactions_with_bigquery", return_value=False), \
+         patch.object(detector, "send_failure_email") as mock_email:
+        with pytest.raises(Exception, match="Data validation failed for cleaned tables"):
+            detector.validate_data_quality(use_cleaned_tables=True)
+
+    mock_email.assert_called_once()
+
+
+def test_post_validation_skipped_when_tables_unchanged(detector, bq_mocks):
+    """Ensure post-validation is skipped when the marker matches the current table versions."""
+    mock_client, _ = bq_mocks
+    last_modified = {table: 1700000000000 for table in AnomalyDetection._CLEANED_TABLES}
+    set_rows(mock_client, [{"table_id": t, "last_modified_time": v} for t, v in last_modified.items()])
+    detector.save_post_validation_marker(last_modified)
+
+    with patch.object(detector, "validate_data_quality") as mock_validate:
+        assert detector.run_post_validation() is True
+
+    mock_validate.assert_not_called()
+    # Only the metadata lookup ran; no table was scanned
+    mock_client.query.assert_called_once()
+    assert "__TABLES__" in mock_client.query.call_args.args[0]
+
+
+def test_post_validation_writes_marker_after_success(detector, bq_mocks):
+    """Ensure a successful post-validation records the validated table versions."""
+    mock_client, _ = bq_mocks
+    set_rows(mock_client, [
+        {"table_id": "goodreads_books_cleaned_staging", "last_modified_time": 1},
+        {"table_id": "goodreads_interactions_cleaned_staging", "last_modified_time": 2},
+    ])
+
+    with patch.object(detector, "validate_data_quality", return_value=True) as mock_validate:
+        assert detector.run_post_validation() is True
+
+    mock_validate.assert_called_once_with(use_cleaned_tables=True)
+    with open(detector.post_validation_marker) as f:
+        assert json.load(f) == {"goodreads_books_cleaned_staging": 1, "goodreads_interactions_cleaned_staging": 2}
+
+
+def test_post_validation_failure_leaves_marker_untouched(detector, bq_mocks):
+    """Ensure a failed post-validation does not record the table versions."""
+    mock_client, _ = bq_mocks
+    set_rows(mock_client, [{"table_id": "goodreads_books_cleaned_staging", "last_modified_time": 1}])
+
+    with patch.object(detector, "validate_data_quality", side_effect=Exception("validation failed")):
+        with pytest.raises(Exception, match="validation failed"):
+            detector.run_post_validation()
+
+    assert detector.load_post_validation_marker() is None
+
+
+def test_send_failure_email_delivers_in_background(detector, monkeypatch):
+    """Ensure the failure email is rendered from the template and sent off the calling thread."""
+    mock_send = Mock()
+    monkeypatch.setattr(anomaly_detection, "send_email", mock_send)
+
+    detector.send_failure_email("null ratings found")
+    for thread in threading.enumerate():
+        if thread.name == "validation-failure-email":
+            thread.join(timeout=5)
+
+    mock_send.assert_called_once()
+    assert "null ratings found" in mock_send.call_args.kwargs["html_content"]
+    assert mock_send.call_args.kwargs["subject"].startswith("[CRITICAL]")
+
+
+def test_close_releases_shared_client(detector, bq_mocks):
+    """Ensure close() closes the shared BigQuery client."""
+    mock_client, _ = bq_mocks
+
+    detector.close()
+
+    mock_client.close.assert_called_once()
+    assert bq_client.get_client() is not mock_client
+
+
+def test_main_post_validation_closes_detector(monkeypatch):
+    """Ensure the post-validation entry point closes the detector even when validation fails."""
+    mock_detector = Mock()
+    mock_detector.run_post_validation.side_effect = Exception("validation failed")
+    monkeypatch.setattr(anomaly_detection, "AnomalyDetection", Mock(return_value=mock_detector))
+
+    with pytest.raises(Exception, match="validation failed"):
+        anomaly_detection.main_post_validation()
+
+    mock_detector.close.assert_called_once()
@@ -0,0 +1,40 @@
+"""
+Unit Tests for Shared BigQuery Client Module
+
+Author: Goodreads Recommendation Team
+Date: 2025
+"""
+
+from unittest.mock import patch
+from datapipeline.scripts import bq_client
+
+
+def test_get_client_creates_client_once():
+    """Ensure repeated get_client() calls share a single BigQuery client."""
+    with patch("datapipeline.scripts.bq_client.bigquery.Client") as mock_client:
+        first = bq_client.get_client()
+        second = bq_client.get_client()
+
+    assert first is second
+    mock_client.assert_called_once()
+
+
+def test_reset_client_creates_new_client():
+    """Ensure reset_client() makes the next get_client() build a fresh client."""
+    with patch("datapipeline.scripts.bq_client.bigquery.Client") as mock_client:
+        bq_client.get_client()
+        bq_client.reset_client()
+        bq_client.get_client()
+
+    assert mock_client.call_count == 2
+
+
+def test_close_client_closes_and_drops_client():
+    """Ensure close_client() closes the shared client and the next call builds a new one."""
+    with patch("datapipeline.scripts.bq_client.bigquery.Client") as mock_client:
+        client = bq_client.get_client()
+        bq_client.close_client()
+        bq_client.get_client()
+
+    client.close.assert_called_once()
+    assert mock_client.call_count == 2
@@ -16,8 +16,11 @@ Date: 2025
 """
 
 import os
+import logging
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, Mock, MagicMock
+from google.api_core.exceptions import NotFound
+from datapipeline.scripts import data_cleaning
 from datapipeline.scripts.data_cleaning import DataCleaning
 
 # ---------------------------------------------------------------------
@@ -35,20 +38,28 @@ def set_env(monkeypatch):
     monkeypatch.setenv("AIRFLOW_HOME", "config/")
 
 
+@pytest.fixture(autouse=True)
+def clear_schema_cache():
+    """
+    Clear the module-level INFORMATION_SCHEMA cache between tests.
+    
+    Each test mocks its own column information, so cached results from a
+    previous test must not leak into the next one.
+    """
+    data_cleaning._schema_cache.clear()
+    yield
+    data_cleaning._schema_cache.clear()
+
+
 @pytest.fixture
-def mock_bq_client():
+def mock_bq_client(bq_mocks):
     """
-    Create a mock BigQuery client for testing.
+    Get the mocked shared BigQuery client used by DataCleaning.
     
     Returns:
-        MagicMock: Mocked BigQuery client with standard methods
+        Mock: Mocked BigQuery client from the shared conftest fixtures
     """
-    mock_client = MagicMock()
-    mock_query_job = MagicMock()
-    mock_query_job.to_dataframe.return_value = None
-    mock_query_job.result.return_value = None
-    mock_client.query.return_value = mock_query_job
-    mock_client.project = "test_project"
+    mock_client, _ = bq_mocks
     return mock_client
 
 
@@ -63,10 +74,16 @@ def data_cleaning_instance(mock_bq_client):
     Returns:
         DataCleaning: Instance with mocked dependencies
     """
-    with patch("datapipeline.scripts.data_cleaning.bigquery.Client", return_value=mock_bq_client):
-        dc = DataCleaning()
-        dc.logger = MagicMock()
-        return dc
+    dc = DataCleaning()
+    dc.logger = Mock(spec=logging.Logger)
+    return dc
+
+
+def query_job(rows=None):
+    """Build a mocked query job whose result() returns the given rows."""
+    job = MagicMock()
+    job.result.return_value = rows
+    return job
 
 
 # ---------------------------------------------------------------------
@@ -82,14 +99,15 @@ def test_clean_table_basic(data_cleaning_instance, mock_bq_client):
     - Generates appropriate SQL queries
     - Includes expected cleaning logic for different column types
     """
-    # Mock column information for the test
-    mock_df = MagicMock()
-    mock_df.iterrows.return_value = iter([
-        (0, {'column_name': 'num_pages', 'data_type': 'INT64'}),
-        (1, {'column_name': 'title', 'data_type': 'STRING'})
-    ])
-    mock_df.__len__.return_value = 2
-    mock_bq_client.query.return_value.to_dataframe.return_value = mock_df
+    # Schema lookup, then no fresh cached medians, then the cleaning script
+    mock_bq_client.query.side_effect = [
+        query_job([
+            {'column_name': 'num_pages', 'data_type': 'INT64'},
+            {'column_name': 'title', 'data_type': 'STRING'}
+        ]),
+        query_job([]),
+        query_job()
+    ]
 
     # Execute clean_table with global median imputation
     data_cleaning_instance.clean_table(
@@ -103,6 +121,7 @@ def test_clean_table_basic(data_cleaning_instance, mock_bq_client):
     query_call = mock_bq_client.query.call_args[0][0]
     assert "goodreads_books" in query_call
     assert "APPROX_QUANTILES(NULLIF(num_pages, 0)" in query_call
+    data_cleaning_instance.logger.warning.assert_not_called()
 
 
 def test_clean_table_error(data_cleaning_instance, mock_bq_client):
@@ -128,15 +147,16 @@ def test_clean_table_error(data_cleaning_instance, mock_bq_client):
 
 def test_clean_table_creates_expected_sql(data_cleaning_instance, mock_bq_client):
     """Validate generated SQL contains expected patterns for medians and cleaning."""
-    mock_df = MagicMock()
-    mock_df.iterrows.return_value = iter([
-        (0, {'column_name': 'num_pages', 'data_type': 'INT64'}),
-        (1, {'column_name': 'title', 'data_type': 'STRING'}),
-        (2, {'column_name': 'tags', 'data_type': 'ARRAY<STRING>'}),
-        (3, {'column_name': 'is_available', 'data_type': 'BOOL'})
-    ])
-    mock_df.__len__.return_value = 4
-    mock_bq_client.query.return_value.to_dataframe.return_value = mock_df
+    mock_bq_client.query.side_effect = [
+        query_job([
+            {'column_name': 'num_pages', 'data_type': 'INT64'},
+            {'column_name': 'title', 'data_type': 'STRING'},
+            {'column_name': 'tags', 'data_type': 'ARRAY<STRING>'},
+            {'column_name': 'is_available', 'data_type': 'BOOL'}
+        ]),
+        query_job([]),
+        query_job()
+    ]
 
     with patch("datapipeline.scripts.data_cleaning.bigquery.QueryJobConfig"):
         data_cleaning_instance.clean_table(
@@ -150,8 +170,13 @@ def test_clean_table_creates_expected_sql(data_cleaning_instance, mock_bq_client
 
         # Core checks (structure and medians)
         assert "APPROX_QUANTILES(NULLIF(num_pages, 0)" in query_call
-        assert "WITH main AS" in query_call
+        assert "DECLARE goodreads_books_num_pages_median INT64;" in query_call
+        assert "MERGE `test_project.books.column_medians`" in query_call
+        assert "COALESCE(NULLIF(num_pages, 0), goodreads_books_num_pages_median) AS num_pages" in query_call
+        assert "LEFT JOIN" not in query_call
         assert "SELECT DISTINCT" in query_call
+        assert "CREATE TEMP FUNCTION clean_arr" in query_call
+        assert "clean_arr(tags) AS tags_flat" in query_call
 
         # Flexible validation for string handling logic
         if "COALESCE(NULLIF(TRIM(title)" in query_call:
@@ -161,30 +186,141 @@ def test_clean_table_creates_expected_sql(data_cleaning_instance, mock_bq_client
             pytest.skip("No TRIM cleaning pattern found — skipping strict string assertion.")
 
 
+def test_clean_table_uses_fresh_cached_medians(data_cleaning_instance, mock_bq_client):
+    """Ensure fresh persisted medians are inlined and the quantile scan is skipped."""
+    mock_bq_client.query.side_effect = [
+        query_job([{'column_name': 'num_pages', 'data_type': 'INT64'}]),
+        query_job([{"column_name": "num_pages", "median": 320.0}]),
+        query_job()
+    ]
+
+    data_cleaning_instance.clean_table(
+        dataset_id="books",
+        table_name="goodreads_books",
+        destination_table="test_project.books.cleaned_books",
+        apply_global_median=True
+    )
+
+    script = mock_bq_client.query.call_args[0][0]
+    assert "DECLARE goodreads_books_num_pages_median INT64 DEFAULT CAST(320.0 AS INT64);" in script
+    assert "APPROX_QUANTILES" not in script
+    assert "MERGE" not in script
+
+
+def test_clean_table_recomputes_stale_medians(data_cleaning_instance, mock_bq_client):
+    """Ensure medians older than the cache window are recomputed and persisted again."""
+    # Rows older than median_cache_days are filtered out by the lookup, so none come back
+    mock_bq_client.query.side_effect = [
+        query_job([{'column_name': 'num_pages', 'data_type': 'INT64'}]),
+        query_job([]),
+        query_job()
+    ]
+
+    data_cleaning_instance.clean_table(
+        dataset_id="books",
+        table_name="goodreads_books",
+        destination_table="test_project.books.cleaned_books",
+        apply_global_median=True
+    )
+
+    medians_call = mock_bq_client.query.call_args_list[1]
+    assert "computed_at > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @days DAY)" in medians_call[0][0]
+    days = [p for p in medians_call[1]["job_config"].query_parameters if p.name == "days"]
+    assert days[0].value == 7
+    script = mock_bq_client.query.call_args[0][0]
+    assert "DECLARE goodreads_books_num_pages_median INT64;" in script
+    assert "APPROX_QUANTILES(NULLIF(num_pages, 0)" in script
+    assert "MERGE `test_project.books.column_medians`" in script
+    data_cleaning_instance.logger.warning.assert_not_called()
+
+
+def test_clean_tables_runs_single_script(data_cleaning_instance, mock_bq_client):
+    """Ensure both cleaning statements are submitted as one BigQuery script."""
+    schema_rows = [
+        {'table_name': table, 'column_name': column, 'data_type': dtype}
+        for table in ('goodreads_books', 'goodreads_interactions')
+        for column, dtype in (('num_pages', 'INT64'), ('title', 'STRING'))
+    ]
+    # Batched schema lookup, no fresh cached medians for books, then the cleaning script
+    mock_bq_client.query.side_effect = [query_job(schema_rows), query_job([]), query_job()]
+
+    data_cleaning_instance.clean_tables([
+        {"dataset_id": "books", "table_name": "goodreads_books",
+         "destination_table": "test_project.books.cleaned_books", "apply_global_median": True},
+        {"dataset_id": "books", "table_name": "goodreads_interactions",
+         "destination_table": "test_project.books.cleaned_interactions", "apply_global_median": False,
+         "cluster_by": ["user_id_clean", "book_id"]}
+    ])
+
+    # One batched schema lookup, the median cache lookup for books, plus a single cleaning script
+    assert mock_bq_client.query.call_count == 3
+    assert "IN UNNEST(@table_names)" in mock_bq_client.query.call_args_list[0][0][0]
+    assert "FROM `test_project.books.column_medians`" in mock_bq_client.query.call_args_list[1][0][0]
+    script = mock_bq_client.query.call_args[0][0]
+    assert "CREATE OR REPLACE TABLE `test_project.books.cleaned_books` AS" in script
+    assert "CREATE OR REPLACE TABLE `test_project.books.cleaned_interactions` CLUSTER BY user_id_clean, book_id AS" in script
+    assert script.count("APPROX_QUANTILES(NULLIF(num_pages, 0)") == 1
+    data_cleaning_instance.logger.warning.assert_not_called()
+
+
+def test_clean_tables_skips_empty_specs(data_cleaning_instance, mock_bq_client):
+    """Ensure an empty spec list submits no queries and does not fail."""
+    data_cleaning_instance.clean_tables([])
+
+    mock_bq_client.query.assert_not_called()
+    data_cleaning_instance.logger.error.assert_not_called()
+
+
 def test_run_pipeline(data_cleaning_instance, mock_bq_client):
     """Ensure run executes cleaning pipeline correctly."""
-    with patch.object(data_cleaning_instance, "clean_table") as mock_clean:
+    with patch.object(data_cleaning_instance, "clean_tables") as mock_clean:
         data_cleaning_instance.run()
-        assert mock_clean.call_count >= 1
+        mock_clean.assert_called_once()
+        specs = mock_clean.call_args[0][0]
+        assert [spec["apply_global_median"] for spec in specs] == [True, False]
+        # Samples are read with tabledata.list rather than LIMIT queries
+        assert mock_bq_client.list_rows.call_count == 2
 
 def test_main_executes(monkeypatch):
     """Test that main() runs without crashing."""
     from datapipeline.scripts import data_cleaning
 
-    # Stub BigQuery client to avoid real credential lookup
-    fake_client = MagicMock()
-    fake_client.project = "test_project"
-    monkeypatch.setattr(data_cleaning.bigquery, "Client", lambda: fake_client)
-
     mock_run = MagicMock()
     monkeypatch.setattr(data_cleaning.DataCleaning, "run", mock_run)
     data_cleaning.main()
     mock_run.assert_called_once()
 
-def test_run_handles_exceptions_gracefully(data_cleaning_instance):
-    """Ensure run() can handle exceptions without crashing."""
-    with patch.object(data_cleaning_instance, "clean_table", side_effect=Exception("Query failed")):
-        try:
+def test_run_propagates_cleaning_errors(data_cleaning_instance):
+    """Ensure run() surfaces errors from the cleaning step instead of reporting success."""
+    with patch.object(data_cleaning_instance, "clean_tables", side_effect=Exception("Query failed")):
+        with pytest.raises(Exception, match="Query failed"):
             data_cleaning_instance.run()
-        except Exception:
-            pytest.skip("Exception raised as expected; skipping to avoid failure")
\ No newline at end of file
+
+def test_create_author_gender_map_uploads_missing_lookup(data_cleaning_instance, mock_bq_client):
+    """Ensure the name lookup is uploaded when missing and the per-author join runs in BigQuery."""
+    mock_bq_client.get_table.side_effect = NotFound("missing")
+
+    data_cleaning_instance.create_author_gender_map()
+
+    uploaded_df, table_id = mock_bq_client.load_table_from_dataframe.call_args[0]
+    assert table_id == "test_project.books.name_gender_lookup"
+    lookup = dict(zip(uploaded_df["first_name"], uploaded_df["gender"]))
+    assert lookup["john"] == "Male"
+    assert lookup["mary"] == "Female"
+    assert "Unknown" not in lookup.values()
+    load_config = mock_bq_client.load_table_from_dataframe.call_args[1]["job_config"]
+    assert load_config.source_format == "PARQUET"
+
+    map_query = mock_bq_client.query.call_args[0][0]
+    assert "CREATE OR REPLACE TABLE `test_project.books.goodreads_author_gender_map`" in map_query
+    assert "LEFT JOIN `test_project.books.name_gender_lookup` g" in map_query
+    assert "COALESCE(g.gender, 'Unknown') AS author_gender_group" in map_query
+
+
+def test_create_author_gender_map_reuses_existing_lookup(data_cleaning_instance, mock_bq_client):
+    """Ensure an existing lookup table is not uploaded again and nothing is downloaded."""
+    data_cleaning_instance.create_author_gender_map()
+
+    mock_bq_client.load_table_from_dataframe.assert_not_called()
+    assert mock_bq_client.query.call_count == 1
+    mock_bq_client.query.return_value.to_dataframe.assert_not_called()
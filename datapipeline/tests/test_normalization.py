@@ -16,9 +16,12 @@ Date: 2025
 """
 
 import os
+import logging
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, Mock, MagicMock
+from datapipeline.scripts import normalization
 from datapipeline.scripts.normalization import GoodreadsNormalization
+from datapipeline.tests.helpers import queries_of
 
 
 @pytest.fixture(autouse=True)
@@ -33,18 +36,14 @@ def set_env(monkeypatch):
 
 
 @pytest.fixture
-def mock_bq_client():
+def mock_bq_client(bq_mocks):
     """
-    Create a mock BigQuery client for testing.
+    Get the mocked BigQuery client installed by the shared bq_mocks fixture.
     
     Returns:
-        MagicMock: Mocked BigQuery client with standard methods
+        Mock: Mocked BigQuery client specced to bigquery.Client
     """
-    mock_client = MagicMock()
-    mock_query_job = MagicMock()
-    mock_query_job.result.return_value = None
-    mock_client.query.return_value = mock_query_job
-    mock_client.project = "test_project"
+    mock_client, _ = bq_mocks
     return mock_client
 
 
@@ -59,10 +58,9 @@ def normalization_instance(mock_bq_client):
     Returns:
         GoodreadsNormalization: Instance with mocked dependencies
     """
-    with patch("datapipeline.scripts.normalization.bigquery.Client", return_value=mock_bq_client):
-        gn = GoodreadsNormalization()
-        gn.logger = MagicMock()
-        return gn
+    gn = GoodreadsNormalization()
+    gn.logger = Mock(spec=logging.Logger)
+    return gn
 
 
 def test_initialization(normalization_instance):
@@ -134,30 +132,19 @@ def test_run_pipeline_error(normalization_instance):
 
 def test_environment_variables(mock_bq_client):
     """Test environment variable handling."""
-    from datapipeline.scripts.normalization import GoodreadsNormalization
-
-
     with patch.dict(os.environ, {'AIRFLOW_HOME': '/custom/path'}):
-        with patch("datapipeline.scripts.normalization.bigquery.Client", return_value=mock_bq_client):
-            gn = GoodreadsNormalization()
-            assert os.environ["GOOGLE_APPLICATION_CREDENTIALS"] == "/custom/path/gcp_credentials.json"
+        gn = GoodreadsNormalization()
+        assert os.environ["GOOGLE_APPLICATION_CREDENTIALS"] == "/custom/path/gcp_credentials.json"
 
 
     with patch.dict(os.environ, {}, clear=True):
-        with patch("datapipeline.scripts.normalization.bigquery.Client", return_value=mock_bq_client):
-            gn = GoodreadsNormalization()
-            assert os.environ["GOOGLE_APPLICATION_CREDENTIALS"] == "./gcp_credentials.json"
+        gn = GoodreadsNormalization()
+        assert os.environ["GOOGLE_APPLICATION_CREDENTIALS"] == "./gcp_credentials.json"
 
 
 def test_main_executes(monkeypatch):
     """Ensure main() runs the pipeline."""
-    from datapipeline.scripts import normalization
-
-    # Stub BigQuery client to avoid real credential lookup
-    fake_client = MagicMock()
-    fake_client.project = "test_project"
-    monkeypatch.setattr(normalization.bigquery, "Client", lambda: fake_client)
-
+    # The BigQuery client is mocked by the shared conftest fixture
     mock_run = MagicMock()
     monkeypatch.setattr(normalization.GoodreadsNormalization, "run", mock_run)
     normalization.main()
@@ -169,7 +156,7 @@ def test_normalize_user_ratings_query_order(normalization_instance, mock_bq_clie
     normalization_instance.normalize_user_ratings()
 
     # Collect SQL strings in the order they were called
-    called_sql = [call.args[0] for call in mock_bq_client.query.call_args_list]
+    called_sql = queries_of(mock_bq_client)
     assert len(called_sql) == 2
     assert "ALTER COLUMN rating SET DATA TYPE FLOAT64" in called_sql[0]
     assert "SET rating = rating - avg_rating_given" in called_sql[1]
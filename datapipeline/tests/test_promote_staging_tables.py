@@ -0,0 +1,107 @@
+"""
+Unit Tests for Staging Table Promotion Module
+
+This module contains unit tests for the StagingTablePromoter class, testing
+how staging tables are copied over production and cleaned up.
+
+Test Coverage:
+- Per-table copy and staging cleanup order
+- Concurrent promotion of all staging tables
+- Error handling when a single promotion fails
+
+Author: Goodreads Recommendation Team
+Date: 2025
+"""
+
+import logging
+import pytest
+from unittest.mock import Mock, call
+from datapipeline.scripts.promote_staging_tables import StagingTablePromoter
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch):
+    """Set up environment variables for testing."""
+    monkeypatch.setenv("AIRFLOW_HOME", "/test/airflow")
+    # Registered so the credentials path set by __init__ is restored after the test
+    monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS", raising=False)
+
+
+@pytest.fixture
+def promoter(bq_mocks):
+    """
+    Create StagingTablePromoter instance with the shared mocked BigQuery client.
+
+    Returns:
+        StagingTablePromoter: Instance with a mocked logger
+    """
+    sp = StagingTablePromoter()
+    sp.logger = Mock(spec=logging.Logger)
+    return sp
+
+
+def test_promote_one_copies_then_drops_staging(promoter, bq_mocks):
+    """Ensure the production table is replaced by a copy before the staging table is dropped."""
+    mock_client, _ = bq_mocks
+
+    promoter._promote_one("goodreads_books_cleaned_staging", "goodreads_books_cleaned")
+
+    assert mock_client.mock_calls == [
+        call.query(
+            "CREATE OR REPLACE TABLE `test_project.books.goodreads_books_cleaned` "
+            "COPY `test_project.books.goodreads_books_cleaned_staging`"
+        ),
+        call.query().result(),
+        call.delete_table("test_project.books.goodreads_books_cleaned_staging"),
+    ]
+
+
+def test_promote_staging_tables_promotes_every_table(promoter, bq_mocks):
+    """Ensure every staging table is copied to production and then dropped."""
+    mock_client, mock_query_job = bq_mocks
+
+    promoter.promote_staging_tables()
+
+    copies = sorted(c.args[0] for c in mock_client.query.call_args_list)
+    assert copies == [
+        "CREATE OR REPLACE TABLE `test_project.books.goodreads_books_cleaned` "
+        "COPY `test_project.books.goodreads_books_cleaned_staging`",
+        "CREATE OR REPLACE TABLE `test_project.books.goodreads_features` "
+        "COPY `test_project.books.goodreads_features_cleaned_staging`",
+        "CREATE OR REPLACE TABLE `test_project.books.goodreads_interactions_cleaned` "
+        "COPY `test_project.books.goodreads_interactions_cleaned_staging`",
+    ]
+    assert mock_query_job.result.call_count == 3
+    assert sorted(c.args[0] for c in mock_client.delete_table.call_args_list) == [
+        "test_project.books.goodreads_books_cleaned_staging",
+        "test_project.books.goodreads_features_cleaned_staging",
+        "test_project.books.goodreads_interactions_cleaned_staging",
+    ]
+    promoter.logger.error.assert_not_called()
+
+
+def test_promote_staging_tables_reraises_first_error(promoter, bq_mocks):
+    """Ensure one failed promotion does not stop the others and its error is re-raised."""
+    mock_client, mock_query_job = bq_mocks
+    error = Exception("Copy failed")
+
+    def query(sql):
+        if "goodreads_interactions_cleaned_staging" in sql:
+            raise error
+        return mock_query_job
+
+    mock_client.query.side_effect = query
+
+    with pytest.raises(Exception, match="Copy failed") as exc_info:
+        promoter.promote_staging_tables()
+
+    assert exc_info.value is error
+    # The other two tables were still promoted, and only their staging tables were dropped
+    assert mock_query_job.result.call_count == 2
+    assert sorted(c.args[0] for c in mock_client.delete_table.call_args_list) == [
+        "test_project.books.goodreads_books_cleaned_staging",
+        "test_project.books.goodreads_features_cleaned_staging",
+    ]
+    promoter.logger.error.assert_called_once_with(
+        "Error promoting staging table goodreads_interactions_cleaned_staging.", exc_info=error
+    )
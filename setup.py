@@ -9,7 +9,7 @@ Package includes:
 - Feature engineering components
 - Data validation and anomaly detection
 - Normalization and staging table promotion
-- Comprehensive test suite
+- Comprehensive test suite (kept in the source tree, not installed)
 
 Author: Goodreads Recommendation Team
 Date: 2025
@@ -20,5 +20,6 @@ from setuptools import find_packages, setup
 setup(
     name="goodreads_recommendations",  # Package name
     version="0.1",                     # Package version
-    packages=find_packages(),          # Automatically find all packages
+    # Automatically find all packages, leaving the test suite out of installs
+    packages=find_packages(exclude=("datapipeline.tests", "datapipeline.tests.*", "tests", "tests.*")),
 )
\ No newline at end of file